@@ -7,7 +7,6 @@ import ChatArea from "./components/ChatArea";
 import UploadBar from "./components/UploadBar";
 import useFirebase from "./hooks/useFirebase";
 import useChatManager from "./hooks/useChatManager";
-import axios from "axios";
 import { set } from "date-fns";
 
 export default function App() {
@@ -18,6 +17,7 @@ export default function App() {
     const [hasUploaded, setHasUploaded] = useState(false);
     const [sidebarOpen, setSidebarOpen] = useState(false);
     const chatContainerRef = useRef(null);
+    const scrollHeightBeforePrependRef = useRef(null); // Set while older messages are being prepended
 
     const {
         handleGoogleLogin,
@@ -34,15 +34,16 @@ export default function App() {
         currentConversationId, setCurrentConversationId,
         createNewConversation,
         updateConversationTitle,
-        saveMessage,
+        sendImageMessage,
         loadConversations,
+        loadMoreConversations,
+        hasMoreConversations,
+        isLoadingMoreConversations,
+        loadOlderMessages,
+        hasOlderMessages,
         deleteConversation
     } = useChatManager(userProfile); 
 
-    const API_BASE_URL = import.meta.env.PROD 
-        ? import.meta.env.VITE_BACKEND_URL_DOCKER || import.meta.env.VITE_BACKEND_URL 
-        : import.meta.env.VITE_BACKEND_URL;
-
     const scrollToBottom = () => {
         if (chatContainerRef.current) {
             chatContainerRef.current.scrollTop = chatContainerRef.current.scrollHeight;
@@ -50,9 +51,26 @@ export default function App() {
     };
 
     useEffect(() => {
+        const container = chatContainerRef.current;
+        if (container && scrollHeightBeforePrependRef.current !== null) {
+            // Older messages were prepended: keep the view anchored on the message the user was reading
+            container.scrollTop = container.scrollHeight - scrollHeightBeforePrependRef.current;
+            scrollHeightBeforePrependRef.current = null;
+            return;
+        }
         scrollToBottom();
     }, [messages, isLoading]);
 
+    const handleChatScroll = async (e) => {
+        if (e.currentTarget.scrollTop > 50 || !hasOlderMessages) return;
+        const previousScrollHeight = e.currentTarget.scrollHeight;
+        scrollHeightBeforePrependRef.current = previousScrollHeight;
+        const loaded = await loadOlderMessages();
+        if (!loaded && scrollHeightBeforePrependRef.current === previousScrollHeight) {
+            scrollHeightBeforePrependRef.current = null;
+        }
+    };
+
     const handleFileChange = (e) => {
         const selectedFile = e.target.files[0];
         if (selectedFile) {
@@ -82,72 +100,18 @@ export default function App() {
             setCurrentConversationId(convId);
         }
 
-        const fileToBase64 = (file) => new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.onload = () => resolve(reader.result);
-            reader.onerror = reject;
-            reader.readAsDataURL(file);
-        });
-
-        const base64Image = await fileToBase64(file);
-        const previewUrl = URL.createObjectURL(file);
-
-        // Create user message object
-        const userMessage = {
-            type: "user",
-            preview: previewUrl,
-            imageData: base64Image,
-            fileName: file.name,
-            conversationId: convId,
-            id: `user-${Date.now()}`,
-        };
-
-        await saveMessage(userMessage, convId);
-        
-        if (messages.length === 0) {
-            await updateConversationTitle(convId, userMessage);
-        }
-
+        const isFirstMessage = messages.length === 0;
         try {
-            const formData = new FormData();
-            formData.append("image", file); 
-
-            const response = await axios.post(
-                `${API_BASE_URL}/process-image`,
-                formData,
-                {
-                    headers: {
-                        "Content-Type": "multipart/form-data",
-                        "Authorization": `Bearer ${userProfile.id_token}`,
-                    },
-                }
-            );
-
-            const { formula } = response.data;
-            const botMsg = {
-                type: "bot",
-                latex: formula || "\\text{Không có công thức}",
-                conversationId: convId,
-                id: `bot-${Date.now() + 1}`,
-            };
-
-            await saveMessage(botMsg, convId);
-        } catch (err) {
-            console.error("Lỗi xử lý ảnh:", err);
-            const botMsg = {
-                type: "bot",
-                latex: "\\text{Đã xảy ra lỗi. Vui lòng thử lại.}",
-                conversationId: convId,
-                id: `bot-${Date.now() + 1}`,
-            };
-
-            await saveMessage(botMsg, convId);
+            const result = await sendImageMessage(file, convId);
+            if (result && isFirstMessage) {
+                await updateConversationTitle(convId, result.userMessage);
+            }
         } finally {
             setFile(null);
             setIsLoading(false);
             setIsUploading(false);
         }
-    }, [file, isUploading, userProfile, messages.length, createNewConversation, saveMessage, updateConversationTitle, API_BASE_URL]);
+    }, [file, isUploading, userProfile, messages.length, createNewConversation, sendImageMessage, updateConversationTitle]);
 
     const handleNewConversation = async () => {
         if (!currentConversationId) {
@@ -198,6 +162,9 @@ export default function App() {
                     onConversationSelect={(id) => setCurrentConversationId(id)}
                     onNewConversation={handleNewConversation}
                     onDeleteConversation={deleteConversation}
+                    onLoadMore={loadMoreConversations}
+                    hasMore={hasMoreConversations}
+                    isLoadingMore={isLoadingMoreConversations}
                     isOpen={sidebarOpen}
                     onClose={() => setSidebarOpen(false)}
                     onRenameConversation={renameConversation}
@@ -241,7 +208,7 @@ export default function App() {
                         )}
 
                         {/* Scrollable Chat Content */}
-                        <div className="flex-1 overflow-y-auto scrollbar-thin" ref={chatContainerRef}>
+                        <div className="flex-1 overflow-y-auto scrollbar-thin" ref={chatContainerRef} onScroll={handleChatScroll}>
                             <div className="flex justify-center min-h-full">
                                 <div className="w-full max-w-4xl flex flex-col">
                                     <ChatArea
@@ -1,4 +1,24 @@
 import { BlockMath } from "react-katex";
+import useBlobUrl from "../hooks/useBlobUrl";
+
+function MessageImage({ msg, idToken }) {
+    // Messages saved in this session still carry their inline image; older ones only have imageRef
+    const blobUrl = useBlobUrl(msg.imageData ? null : msg.imageRef, idToken);
+    const src = msg.imageData || blobUrl || (msg.imageRef ? null : msg.preview);
+    if (!src) return null;
+    return (
+        <img
+            src={src}
+            alt={msg.fileName || "Uploaded image"}
+            className="max-w-full rounded mb-2"
+            style={{ maxWidth: "250px" }}
+            onError={(e) => {
+                e.target.style.display = 'none';
+                e.target.nextSibling.style.display = 'block';
+            }}
+        />
+    );
+}
 
 export default function ChatArea({ messages, isLoading, userProfile, chatContainerRef }) {
     return (
@@ -36,17 +56,8 @@ export default function ChatArea({ messages, isLoading, userProfile, chatContain
                                         : "bg-[#2c2c2c] text-[#e5e7eb] rounded-bl-none"
                                 } p-4 rounded-xl max-w-[80%] md:max-w-[70%] break-words`}
                             >
-                                {msg.type === "user" && (msg.preview || msg.imageData) && (
-                                    <img
-                                        src={msg.imageData || msg.preview}
-                                        alt={msg.fileName || "Uploaded image"}
-                                        className="max-w-full rounded mb-2"
-                                        style={{ maxWidth: "250px" }}
-                                        onError={(e) => {
-                                            e.target.style.display = 'none';
-                                            e.target.nextSibling.style.display = 'block';
-                                        }}
-                                    />
+                                {msg.type === "user" && (msg.preview || msg.imageData || msg.imageRef) && (
+                                    <MessageImage msg={msg} idToken={userProfile.id_token} />
                                 )}
                                 {msg.type === "user" && msg.fileName && (
                                     <div
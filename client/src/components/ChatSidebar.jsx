@@ -8,6 +8,9 @@ const ChatSidebar = ({
     onConversationSelect, 
     onNewConversation, 
     onDeleteConversation,
+    onLoadMore,
+    hasMore,
+    isLoadingMore,
     isOpen,
     onClose,
     onRenameConversation,
@@ -65,6 +68,14 @@ const ChatSidebar = ({
         setDeleteConfirm(null);
     };
 
+    // Load the next page of conversations when the list is scrolled near its end
+    const handleListScroll = (e) => {
+        const { scrollTop, scrollHeight, clientHeight } = e.currentTarget;
+        if (hasMore && !isLoadingMore && scrollHeight - scrollTop - clientHeight < 100) {
+            onLoadMore();
+        }
+    };
+
     return (
         <>
             {/* Overlay for mobile */}
@@ -126,7 +137,7 @@ const ChatSidebar = ({
                 </div>
 
                 {/* Conversations List */}
-                <div className="flex-1 overflow-y-auto px-4 pb-4">
+                <div className="flex-1 overflow-y-auto px-4 pb-4" onScroll={handleListScroll}>
                     {conversations === null ? (
                         <div className="flex items-center justify-center h-32">
                             <div className="animate-spin rounded-full h-6 w-6 border-b-2 border-[#e5e7eb]"></div>
@@ -235,6 +246,11 @@ const ChatSidebar = ({
                                     )}
                                 </div>
                             ))}
+                            {isLoadingMore && (
+                                <div className="flex items-center justify-center py-3">
+                                    <div className="animate-spin rounded-full h-5 w-5 border-b-2 border-[#e5e7eb]"></div>
+                                </div>
+                            )}
                         </div>
                     )}
                 </div>
@@ -0,0 +1,40 @@
+import { useState, useEffect } from "react";
+import axios from "axios";
+
+const API_BASE_URL = import.meta.env.PROD
+    ? import.meta.env.VITE_BACKEND_URL_DOCKER || import.meta.env.VITE_BACKEND_URL
+    : import.meta.env.VITE_BACKEND_URL;
+
+// Lazily fetches a stored image by its content hash and exposes it as an object URL.
+// The server marks blobs immutable, so the browser cache answers repeat fetches.
+export default function useBlobUrl(imageRef, idToken) {
+    const [url, setUrl] = useState(null);
+
+    useEffect(() => {
+        if (!imageRef || !idToken) {
+            setUrl(null);
+            return;
+        }
+        let objectUrl = null;
+        let cancelled = false;
+        axios.get(`${API_BASE_URL}/chat/blobs/${imageRef}`, {
+            headers: { Authorization: `Bearer ${idToken}` },
+            responseType: "blob",
+        })
+            .then(response => {
+                if (cancelled) return;
+                objectUrl = URL.createObjectURL(response.data);
+                setUrl(objectUrl);
+            })
+            .catch(error => {
+                console.error("Error loading image:", error.response?.status || error.message);
+            });
+
+        return () => {
+            cancelled = true;
+            if (objectUrl) URL.revokeObjectURL(objectUrl);
+        };
+    }, [imageRef, idToken]);
+
+    return url;
+}
@@ -5,6 +5,10 @@ export default function useChatManager(userProfile) {
     const [messages, setMessages] = useState([]);
     const [conversations, setConversations] = useState([]);
     const [currentConversationId, setCurrentConversationId] = useState(null);
+    const [conversationsCursor, setConversationsCursor] = useState(null); // nextCursor of the last loaded page
+    const [messagesCursor, setMessagesCursor] = useState(null);
+    const [isLoadingMoreConversations, setIsLoadingMoreConversations] = useState(false);
+    const [isLoadingOlderMessages, setIsLoadingOlderMessages] = useState(false);
 
     const API_BASE_URL = import.meta.env.PROD 
         ? import.meta.env.VITE_BACKEND_URL_DOCKER || import.meta.env.VITE_BACKEND_URL 
@@ -106,9 +110,69 @@ export default function useChatManager(userProfile) {
     }, [userProfile, API_BASE_URL, getAuthHeaders]);
 
 
+    // Uploads an image to a conversation in one request: the server stores the user's
+    // message and runs OCR concurrently, then returns both it and the bot's reply
+    const sendImageMessage = useCallback(async (file, conversationId) => {
+        if (!conversationId || !userProfile?.uid) {
+            console.error("Not in a conversation or user not authenticated to send an image.");
+            return null;
+        }
+        const localId = `user-${Date.now()}`;
+        const previewUrl = URL.createObjectURL(file);
+        setMessages(prev => [...prev, {
+            id: localId,
+            type: "user",
+            preview: previewUrl,
+            fileName: file.name,
+            conversationId,
+        }]);
+
+        try {
+            const formData = new FormData();
+            formData.append("image", file);
+            const response = await axios.post(
+                `${API_BASE_URL}/chat/conversations/${conversationId}/images`,
+                formData,
+                {
+                    headers: {
+                        ...getAuthHeaders().headers,
+                        "Content-Type": "multipart/form-data",
+                    },
+                }
+            );
+            const { userMessage, botMessage } = response.data;
+
+            // Keep showing the local preview instead of downloading the image we just sent
+            setMessages(prev => [
+                ...prev.map(msg => msg.id === localId ? { ...userMessage, imageRef: null, preview: previewUrl } : msg),
+                botMessage,
+            ]);
+            setConversations(prev =>
+                prev.map(conv =>
+                    conv.id === conversationId ? {
+                        ...conv,
+                        lastMessageAt: botMessage.timestamp,
+                        messageCount: conv.messageCount + 2
+                    } : conv
+                ).sort((a, b) => b.lastMessageAt - a.lastMessageAt)
+            );
+            return response.data;
+        } catch (error) {
+            console.error("Lỗi xử lý ảnh:", error.response?.data || error.message);
+            setMessages(prev => [...prev, {
+                id: `bot-${Date.now()}`,
+                type: "bot",
+                latex: "\\text{Đã xảy ra lỗi. Vui lòng thử lại.}",
+                conversationId,
+            }]);
+            return null;
+        }
+    }, [userProfile, API_BASE_URL, getAuthHeaders]);
+
     const loadConversations = useCallback(async () => {
         if (!userProfile?.uid || userProfile.isAnonymous) {
             setConversations([]);
+            setConversationsCursor(null);
             setCurrentConversationId(null);
             setMessages([]);
             return;
@@ -119,20 +183,45 @@ export default function useChatManager(userProfile) {
                 `${API_BASE_URL}/chat/conversations`,
                 getAuthHeaders()
             );
-            const loadedConversations = response.data;
-            setConversations(loadedConversations);
+            const { items, nextCursor } = response.data;
+            setConversations(items);
+            setConversationsCursor(nextCursor);
             setCurrentConversationId(null);
         } catch (error) {
             console.error("Error loading conversations:", error.response?.data || error.message);
             alert(`Tải cuộc trò chuyện thất bại: ${error.response?.data?.detail || error.message}`);
             setConversations([]);
+            setConversationsCursor(null);
             setCurrentConversationId(null);
         }
     }, [userProfile, API_BASE_URL, getAuthHeaders]);
 
+    // Fetch the next page of (older) conversations, e.g. when the sidebar is scrolled to the bottom
+    const loadMoreConversations = useCallback(async () => {
+        if (!conversationsCursor || isLoadingMoreConversations || !userProfile?.uid) return;
+        setIsLoadingMoreConversations(true);
+        try {
+            const response = await axios.get(
+                `${API_BASE_URL}/chat/conversations`,
+                { ...getAuthHeaders(), params: { cursor: conversationsCursor } }
+            );
+            const { items, nextCursor } = response.data;
+            setConversations(prev => {
+                const loadedIds = new Set((prev || []).map(conv => conv.id));
+                return [...(prev || []), ...items.filter(conv => !loadedIds.has(conv.id))];
+            });
+            setConversationsCursor(nextCursor);
+        } catch (error) {
+            console.error("Error loading more conversations:", error.response?.data || error.message);
+        } finally {
+            setIsLoadingMoreConversations(false);
+        }
+    }, [userProfile, conversationsCursor, isLoadingMoreConversations, API_BASE_URL, getAuthHeaders]);
+
     const loadMessages = useCallback(async (convId) => {
         if (!convId || !userProfile?.uid) {
             setMessages([]);
+            setMessagesCursor(null);
             return;
         }
         try {
@@ -140,15 +229,42 @@ export default function useChatManager(userProfile) {
                 `${API_BASE_URL}/chat/conversations/${convId}/messages`,
                 getAuthHeaders()
             );
-            setMessages(response.data);
+            const { items, nextCursor } = response.data;
+            setMessages(items);
+            setMessagesCursor(nextCursor);
             console.log(`Messages loaded for conversation ${convId}`);
         } catch (error) {
             console.error(`Error loading messages for conversation ${convId}:`, error.response?.data || error.message);
             alert(`Tải tin nhắn thất bại: ${error.response?.data?.detail || error.message}`);
             setMessages([]); // Clear messages on error
+            setMessagesCursor(null);
         }
     }, [userProfile, API_BASE_URL, getAuthHeaders]);
 
+    // Prepend the page of messages before the oldest loaded one, e.g. when the chat is scrolled to the top
+    const loadOlderMessages = useCallback(async () => {
+        if (!currentConversationId || !messagesCursor || isLoadingOlderMessages || !userProfile?.uid) return false;
+        setIsLoadingOlderMessages(true);
+        try {
+            const response = await axios.get(
+                `${API_BASE_URL}/chat/conversations/${currentConversationId}/messages`,
+                { ...getAuthHeaders(), params: { cursor: messagesCursor } }
+            );
+            const { items, nextCursor } = response.data;
+            setMessages(prev => {
+                const loadedIds = new Set(prev.map(msg => msg.id));
+                return [...items.filter(msg => !loadedIds.has(msg.id)), ...prev];
+            });
+            setMessagesCursor(nextCursor);
+            return items.length > 0;
+        } catch (error) {
+            console.error(`Error loading older messages for conversation ${currentConversationId}:`, error.response?.data || error.message);
+            return false;
+        } finally {
+            setIsLoadingOlderMessages(false);
+        }
+    }, [userProfile, currentConversationId, messagesCursor, isLoadingOlderMessages, API_BASE_URL, getAuthHeaders]);
+
 
     const deleteConversation = useCallback(async (convId) => {
         if (!userProfile?.uid || !convId) {
@@ -191,6 +307,7 @@ export default function useChatManager(userProfile) {
     useEffect(() => {
         if (!currentConversationId || !userProfile?.uid) { // Ensure user is logged in
             setMessages([]); // Clear messages if no current conversation or not logged in
+            setMessagesCursor(null);
             return;
         }
         loadMessages(currentConversationId);
@@ -205,7 +322,13 @@ export default function useChatManager(userProfile) {
         createNewConversation,
         updateConversationTitle,
         saveMessage,
+        sendImageMessage,
         loadConversations,
+        loadMoreConversations,
+        hasMoreConversations: Boolean(conversationsCursor),
+        isLoadingMoreConversations,
+        loadOlderMessages,
+        hasOlderMessages: Boolean(messagesCursor),
         deleteConversation,
     };
 }
\ No newline at end of file
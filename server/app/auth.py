@@ -2,24 +2,32 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
 from firebase_admin import auth, credentials
-from dotenv import load_dotenv
+from firebase_admin import _token_gen
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import asyncio
+import hashlib
 import os
 import json
 import logging
+import time
 from typing import Optional, Dict
 from pydantic import BaseModel
 
 from models import UserProfile
-
-load_dotenv()
+from config import settings
+from metrics import timed_stage
 
 logger = logging.getLogger(__name__)
 
 # --- Firebase Admin SDK Initialization ---
 firebase_admin_initialized = False
 
-def initialize_firebase():
-    """Initialize Firebase Admin SDK"""
+def initialize_firebase() -> bool:
+    """
+    Initialize Firebase Admin SDK and return whether it is usable. Called from the
+    application lifespan, so importing this module needs no credentials.
+    """
     global firebase_admin_initialized
     
     try:
@@ -28,7 +36,7 @@ def initialize_firebase():
             firebase_admin.get_app()
             logger.info("Firebase Admin SDK already initialized.")
             firebase_admin_initialized = True
-            return
+            return True
         except ValueError:
             # App doesn't exist, proceed with initialization
             pass
@@ -58,8 +66,119 @@ def initialize_firebase():
     except Exception as e:
         logger.error(f"Error initializing Firebase Admin SDK: {e}", exc_info=True)
         firebase_admin_initialized = False
+    return firebase_admin_initialized
+
+# --- Verified token cache ---
+class TokenCache:
+    """
+    LRU cache of decoded Firebase ID tokens keyed by the SHA-256 of the raw token.
+    Entries are only served until the token's own 'exp' claim, so a cached token
+    is never accepted after Firebase would have rejected it as expired.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(id_token: str) -> str:
+        return hashlib.sha256(id_token.encode()).hexdigest()
+
+    def get(self, id_token: str) -> Optional[Dict]:
+        key = self._key(id_token)
+        decoded_token = self._entries.get(key)
+        if decoded_token is not None:
+            if decoded_token.get('exp', 0) > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return decoded_token
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, id_token: str, decoded_token: Dict):
+        key = self._key(id_token)
+        self._entries[key] = decoded_token
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_MAX_ENTRIES)
+# Signature checks and certificate fetches are synchronous; keep them off the event loop
+_verify_executor = ThreadPoolExecutor(max_workers=settings.AUTH_VERIFY_WORKERS, thread_name_prefix="token-verify")
+
+async def verify_id_token_cached(id_token: str) -> Dict:
+    """Verify a Firebase ID token, serving repeat tokens from the cache."""
+    if settings.AUTH_TOKEN_CACHE_ENABLED:
+        decoded_token = token_cache.get(id_token)
+        if decoded_token is not None:
+            return decoded_token
+    decoded_token = await asyncio.get_running_loop().run_in_executor(_verify_executor, auth.verify_id_token, id_token)
+    if settings.AUTH_TOKEN_CACHE_ENABLED:
+        token_cache.set(id_token, decoded_token)
+    return decoded_token
+
+def get_token_cache_stats() -> Dict:
+    return token_cache.stats() if settings.AUTH_TOKEN_CACHE_ENABLED else {"enabled": False}
 
-initialize_firebase()
+# --- Public certificate prefetching ---
+_cert_refresh_task: Optional[asyncio.Task] = None
+
+def is_firebase_initialized() -> bool:
+    return firebase_admin_initialized
+
+def _fetch_id_token_certificates():
+    """
+    Fetch Google's ID token signing certificates through the Firebase token
+    verifier's own HTTP-cached transport, so the next verify_id_token() call
+    finds them in cache instead of fetching them on the request path.
+    """
+    verifier = auth._get_client(None)._token_verifier
+    verifier.request(_token_gen.ID_TOKEN_CERT_URI)
+
+async def refresh_certificates():
+    """Fetch the signing certificates once. Part of the startup warm-up, then repeated in the background."""
+    if not firebase_admin_initialized:
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(_verify_executor, _fetch_id_token_certificates)
+        logger.info("Firebase ID token certificates refreshed.")
+    except Exception as e:
+        logger.warning(f"Failed to refresh Firebase ID token certificates: {e}")
+
+async def _refresh_certificates_periodically():
+    while True:
+        await asyncio.sleep(settings.AUTH_CERT_REFRESH_INTERVAL)
+        await refresh_certificates()
+
+def start_certificate_refresh():
+    """Keep signing certificates fresh in the background. Called from the application lifespan."""
+    global _cert_refresh_task
+    if firebase_admin_initialized and _cert_refresh_task is None:
+        _cert_refresh_task = asyncio.create_task(_refresh_certificates_periodically())
+
+async def stop_certificate_refresh():
+    global _cert_refresh_task
+    if _cert_refresh_task is not None:
+        _cert_refresh_task.cancel()
+        try:
+            await _cert_refresh_task
+        except asyncio.CancelledError:
+            pass
+        _cert_refresh_task = None
 
 # --- Pydantic Models for Authentication ---
 class VerifyTokenRequest(BaseModel):
@@ -80,7 +199,8 @@ async def verify_firebase_id_token(credentials: HTTPAuthorizationCredentials = D
             detail="Firebase Admin SDK is not initialized. Authentication is disabled."
         )
     try:
-        decoded_token = auth.verify_id_token(credentials.credentials)
+        with timed_stage("auth"):
+            decoded_token = await verify_id_token_cached(credentials.credentials)
         return decoded_token
     except Exception as e:
         logger.error(f"Firebase ID token verification failed: {e}", exc_info=True)
@@ -119,7 +239,7 @@ async def verify_token_endpoint(
             detail="Firebase Admin SDK is not initialized. Authentication is disabled."
         )
     try:
-        decoded_token = auth.verify_id_token(request.idToken)
+        decoded_token = await verify_id_token_cached(request.idToken)
         user_profile = UserProfile(
             uid=decoded_token.get('uid'),
             email=decoded_token.get('email'),
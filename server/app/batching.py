@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Dict, Union
+
+from fastapi import HTTPException, status
+
+from resilience import UpstreamUnavailableError
+
+logger = logging.getLogger(__name__)
+
+PredictResult = tuple[str, float]
+SendBatch = Callable[[List[bytes]], Awaitable[List[Union[PredictResult, Exception]]]]
+SendSingle = Callable[[bytes], Awaitable[PredictResult]]
+
+class BatchUnsupportedError(Exception):
+    """Raised by a batch sender when the Model API has no batch endpoint."""
+
+def _batch_error(error: Exception) -> HTTPException:
+    """A failed batch call as one image's error. Each caller gets its own instance, of the same type, so retry decisions still apply."""
+    if isinstance(error, HTTPException):
+        return type(error)(status_code=error.status_code, detail=error.detail, headers=error.headers)
+    return HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Model API batch error: {error}")
+
+class _PendingImage:
+    __slots__ = ("image_data", "future")
+
+    def __init__(self, image_data: bytes, future: asyncio.Future):
+        self.image_data = image_data
+        self.future = future
+
+class BatchDispatcher:
+    """
+    Collects images submitted within a short window (or until the batch is full)
+    and sends them to the Model API as one batch request, then resolves each
+    caller with its own result. Falls back to single predictions when the
+    endpoint does not exist. When the batch call fails, every image in it fails
+    with that error, and retrying is left to the caller.
+    """
+
+    def __init__(
+        self,
+        send_batch: SendBatch,
+        send_single: SendSingle,
+        max_batch_size: int,
+        window_seconds: float,
+        queue_size: int,
+        request_timeout: float,
+    ):
+        self.send_batch = send_batch
+        self.send_single = send_single
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self.request_timeout = request_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatches: set = set()
+        self.batch_supported = True
+        self.batches = 0
+        self.batched_images = 0
+        self.fallbacks = 0
+        self.failed_batches = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+            logger.info(
+                f"Batch dispatcher started (max_batch_size={self.max_batch_size}, "
+                f"window={self.window_seconds * 1000:.0f} ms, queue_size={self._queue.maxsize})"
+            )
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+        while not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(UpstreamUnavailableError(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server is shutting down."
+                ))
+        logger.info("Batch dispatcher stopped.")
+
+    async def submit(self, image_data: bytes) -> PredictResult:
+        """Queue an image and wait for its prediction."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_PendingImage(image_data, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning("Batch queue is full. Rejecting OCR request.")
+            raise UpstreamUnavailableError(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OCR service is busy. Please retry shortly.",
+                headers={"Retry-After": "1"}
+            )
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.request_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            future.cancel() # Tells the dispatcher to skip or discard this image
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Timed out waiting for the Model API."
+            )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch = [pending for pending in batch if not pending.future.done()]
+            if not batch:
+                continue
+            # Dispatch in the background so the next batch can start collecting immediately
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[_PendingImage]):
+        results: List[Union[PredictResult, Exception]]
+        if len(batch) == 1 or not self.batch_supported:
+            results = await self._send_singles(batch)
+        else:
+            try:
+                results = await self.send_batch([pending.image_data for pending in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"Model API returned {len(results)} results for a batch of {len(batch)} images.")
+                self.batches += 1
+                self.batched_images += len(batch)
+            except BatchUnsupportedError as e:
+                logger.warning(f"Model API batch endpoint is unavailable ({e}). Falling back to single predictions.")
+                self.batch_supported = False
+                self.fallbacks += 1
+                results = await self._send_singles(batch)
+            except Exception as e:
+                logger.warning(f"Batch prediction of {len(batch)} images failed ({e}).")
+                self.failed_batches += 1
+                results = [_batch_error(e) for _ in batch]
+
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, Exception):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+
+    async def _send_singles(self, batch: List[_PendingImage]) -> List[Union[PredictResult, Exception]]:
+        return await asyncio.gather(
+            *(self.send_single(pending.image_data) for pending in batch),
+            return_exceptions=True
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": True,
+            "batch_supported": self.batch_supported,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "batched_images": self.batched_images,
+            "avg_batch_size": round(self.batched_images / self.batches, 2) if self.batches else 0,
+            "fallbacks": self.fallbacks,
+            "failed_batches": self.failed_batches,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,169 @@
+import asyncio
+import base64
+import binascii
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Optional, Union
+
+from cache import image_digest
+from config import settings
+from imaging import sniff_content_type
+from uploads import SpooledImage
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL_RE = re.compile(r"^data:(?P<content_type>[\w.+-]+/[\w.+-]+)?(?:;[\w-]+=[^;,]*)*;base64,(?P<data>.*)$", re.DOTALL)
+
+class InvalidBlobError(ValueError):
+    """Raised when inline image data cannot be decoded or is too large."""
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(_DIGEST_RE.match(digest))
+
+def decode_data_url(value: str) -> tuple[bytes, str]:
+    """Decode a base64 'data:' URL into its bytes and content type."""
+    match = _DATA_URL_RE.match(value)
+    if not match:
+        raise InvalidBlobError("Expected a base64 data URL.")
+    encoded = match.group("data")
+    if len(encoded) * 3 // 4 > settings.MAX_UPLOAD_BYTES:
+        raise InvalidBlobError("Image is too large.")
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raise InvalidBlobError("Invalid base64 image data.")
+    return data, match.group("content_type") or sniff_content_type(data)
+
+class Blob:
+    __slots__ = ("data", "content_type")
+
+    def __init__(self, data: bytes, content_type: str):
+        self.data = data
+        self.content_type = content_type
+
+# --- Backends ---
+class LocalBlobStore:
+    """Stores each blob as a file named by its SHA-256 under a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _write(self, digest: str, data: Union[bytes, SpooledImage]):
+        path = self._path(digest)
+        if os.path.exists(path):
+            return # Content-addressed: identical bytes are already stored
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temp file of its own: concurrent uploads of the same image write the same digest from several threads
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{digest}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, SpooledImage):
+                    data.copy_to(f)
+                else:
+                    f.write(data)
+            os.replace(tmp_path, path) # Atomic; if another writer got there first, it stored the same bytes
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def put(self, digest: str, data: Union[bytes, SpooledImage], content_type: str):
+        await asyncio.to_thread(self._write, digest, data)
+
+    async def get(self, digest: str) -> Optional[Blob]:
+        data = await asyncio.to_thread(self._read, digest)
+        return Blob(data, sniff_content_type(data, default="application/octet-stream")) if data is not None else None
+
+class GCSBlobStore:
+    """Stores blobs as objects in a Google Cloud Storage bucket (the Firebase Storage bucket by default)."""
+
+    def __init__(self, bucket_name: Optional[str], prefix: str):
+        from firebase_admin import storage
+        self.bucket = storage.bucket(bucket_name)
+        self.prefix = prefix
+
+    def _write(self, digest: str, data: Union[bytes, SpooledImage], content_type: str):
+        blob = self.bucket.blob(self.prefix + digest)
+        if blob.exists():
+            return
+        blob.cache_control = "private, max-age=31536000, immutable"
+        if not isinstance(data, SpooledImage):
+            blob.upload_from_string(data, content_type=content_type)
+            return
+        # Upload from a private copy, so OCR is not kept from reading the upload for a whole network transfer
+        upload = data.copy()
+        try:
+            blob.upload_from_file(upload.rewind(), size=upload.size, content_type=content_type)
+        finally:
+            upload.close()
+
+    def _read(self, digest: str) -> Optional[Blob]:
+        blob = self.bucket.get_blob(self.prefix + digest)
+        if blob is None:
+            return None
+        return Blob(blob.download_as_bytes(), blob.content_type or "application/octet-stream")
+
+    async def put(self, digest: str, data: Union[bytes, SpooledImage], content_type: str):
+        await asyncio.to_thread(self._write, digest, data, content_type)
+
+    async def get(self, digest: str) -> Optional[Blob]:
+        return await asyncio.to_thread(self._read, digest)
+
+class BlobStore:
+    """Content-addressed image storage: blobs are written once and referenced by their SHA-256."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def put(self, data: bytes, content_type: str, digest: Optional[str] = None) -> str:
+        """Store bytes and return their SHA-256; pass `digest` when it is already known."""
+        digest = digest or image_digest(data)
+        await self.backend.put(digest, data, content_type)
+        return digest
+
+    async def put_upload(self, image: SpooledImage) -> str:
+        """Store an uploaded image straight from its spooled file and return its SHA-256."""
+        await self.backend.put(image.digest, image, sniff_content_type(image.head, default=image.content_type))
+        return image.digest
+
+    async def put_data_url(self, value: str) -> str:
+        data, content_type = decode_data_url(value)
+        return await self.put(data, content_type)
+
+    async def get(self, digest: str) -> Optional[Blob]:
+        if not is_valid_digest(digest):
+            return None
+        return await self.backend.get(digest)
+
+def _create_backend():
+    backend = settings.BLOB_STORE_BACKEND.lower()
+    if backend == "gcs":
+        return GCSBlobStore(settings.BLOB_STORE_BUCKET, settings.BLOB_STORE_PREFIX)
+    if backend != "local":
+        logger.warning(f"Unknown BLOB_STORE_BACKEND '{settings.BLOB_STORE_BACKEND}'. Using the local filesystem.")
+    return LocalBlobStore(settings.BLOB_STORE_DIR)
+
+_blob_store: Optional[BlobStore] = None
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(_create_backend())
+    return _blob_store
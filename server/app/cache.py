@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def image_digest(image_data: bytes) -> str:
+    """Content address of an image: hex SHA-256 of its bytes."""
+    return hashlib.sha256(image_data).hexdigest()
+
+# --- Shared (second tier) backends ---
+class DiskCacheBackend:
+    """Stores one JSON file per key in a directory shared by all workers."""
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def _write(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temp file of its own: the same key can be written from several threads and workers at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + self.ttl, "value": value}, f)
+            os.replace(tmp_path, path) # Atomic so concurrent readers never see a partial file
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        await asyncio.to_thread(self._write, key, value)
+
+    async def close(self):
+        pass
+
+class RedisCacheBackend:
+    """Stores entries in any Redis-protocol server (Redis, Valkey, KeyDB, ...)."""
+
+    def __init__(self, url: str, ttl: int, prefix: str = "latex:"):
+        import redis.asyncio as redis_asyncio # Optional dependency
+        self.client = redis_asyncio.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    async def close(self):
+        await self.client.aclose()
+
+# --- Two-tier LaTeX result cache ---
+class LatexCache:
+    """
+    LRU + TTL cache of Model API results keyed by image digest.
+    Lookups hit the in-process tier first and fall back to the optional shared tier.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get_local(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Shared LaTeX cache lookup failed: {e}")
+                value = None
+            if value is not None:
+                self.hits += 1
+                self.shared_hits += 1
+                self._set_local(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        self._set_local(key, value)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, value)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Shared LaTeX cache write failed: {e}")
+
+    async def close(self):
+        if self.shared is not None:
+            await self.shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "backend": type(self.shared).__name__ if self.shared is not None else "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+def _create_shared_backend():
+    backend = settings.LATEX_CACHE_BACKEND.lower()
+    if backend == "memory":
+        return None
+    if backend == "disk":
+        return DiskCacheBackend(settings.LATEX_CACHE_DIR, settings.LATEX_CACHE_TTL)
+    if backend == "redis":
+        if not settings.LATEX_CACHE_REDIS_URL:
+            logger.warning("LATEX_CACHE_BACKEND is 'redis' but LATEX_CACHE_REDIS_URL is not set. Using in-process cache only.")
+            return None
+        try:
+            return RedisCacheBackend(settings.LATEX_CACHE_REDIS_URL, settings.LATEX_CACHE_TTL)
+        except ImportError:
+            logger.warning("LATEX_CACHE_BACKEND is 'redis' but the 'redis' package is not installed. Using in-process cache only.")
+            return None
+    logger.warning(f"Unknown LATEX_CACHE_BACKEND '{settings.LATEX_CACHE_BACKEND}'. Using in-process cache only.")
+    return None
+
+_latex_cache: Optional[LatexCache] = None
+
+def get_latex_cache() -> Optional[LatexCache]:
+    """Returns the process-wide LaTeX cache, or None when caching is disabled."""
+    global _latex_cache
+    if not settings.LATEX_CACHE_ENABLED:
+        return None
+    if _latex_cache is None:
+        _latex_cache = LatexCache(
+            max_entries=settings.LATEX_CACHE_MAX_ENTRIES,
+            ttl=settings.LATEX_CACHE_TTL,
+            shared=_create_shared_backend(),
+        )
+    return _latex_cache
+
+async def close_latex_cache():
+    global _latex_cache
+    if _latex_cache is not None:
+        await _latex_cache.close()
+        _latex_cache = None
+
+def get_latex_cache_stats() -> Dict[str, Any]:
+    cache = get_latex_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+# --- Per-user conversation list cache ---
+class ConversationListCache:
+    """
+    Serialized conversation list pages per user, keyed by (limit, cursor), with
+    an LRU over users, an LRU over each user's pages (the client picks the keys,
+    so their number must be capped) and a TTL; expired pages are dropped when
+    read. Writes to a user's conversations invalidate all of their pages. A page
+    read from Firestore is only stored if no invalidation for that user happened
+    while it was being read, so a slow read cannot put a stale page back after a
+    concurrent write.
+    """
+
+    def __init__(self, max_users: int, max_pages_per_user: int, ttl: int):
+        self.max_users = max_users
+        self.max_pages_per_user = max_pages_per_user
+        self.ttl = ttl
+        self._users: "OrderedDict[str, OrderedDict[tuple, tuple[float, bytes, str]]]" = OrderedDict()
+        self._generation = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict() # uid -> generation of its last invalidation
+        self._forgotten_generation = 0 # newest invalidation dropped from _invalidated
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, uid: str, key: tuple) -> Optional[tuple[bytes, str]]:
+        pages = self._users.get(uid)
+        entry = pages.get(key) if pages is not None else None
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del pages[key]
+                if not pages:
+                    del self._users[uid]
+            self.misses += 1
+            return None
+        pages.move_to_end(key)
+        self._users.move_to_end(uid)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def generation(self) -> int:
+        """Taken before reading a page from Firestore and handed back to set()."""
+        return self._generation
+
+    def set(self, uid: str, key: tuple, generation: int, body: bytes, etag: str):
+        if max(self._invalidated.get(uid, 0), self._forgotten_generation) > generation:
+            return # Invalidated while the page was being read
+        pages = self._users.setdefault(uid, OrderedDict())
+        pages[key] = (time.monotonic() + self.ttl, body, etag)
+        pages.move_to_end(key)
+        while len(pages) > self.max_pages_per_user:
+            pages.popitem(last=False)
+            self.evictions += 1
+        self._users.move_to_end(uid)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, uid: str):
+        self._generation += 1
+        self._users.pop(uid, None)
+        self._invalidated[uid] = self._generation
+        self._invalidated.move_to_end(uid)
+        self.invalidations += 1
+        while len(self._invalidated) > self.max_users:
+            _, forgotten = self._invalidated.popitem(last=False)
+            self._forgotten_generation = max(self._forgotten_generation, forgotten)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "users": len(self._users),
+            "pages": sum(len(pages) for pages in self._users.values()),
+            "max_users": self.max_users,
+            "max_pages_per_user": self.max_pages_per_user,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+_conversation_list_cache: Optional[ConversationListCache] = None
+
+def get_conversation_list_cache() -> Optional[ConversationListCache]:
+    """Returns the process-wide conversation list cache, or None when it is disabled."""
+    global _conversation_list_cache
+    if not settings.CONVERSATION_CACHE_ENABLED:
+        return None
+    if _conversation_list_cache is None:
+        _conversation_list_cache = ConversationListCache(
+            max_users=settings.CONVERSATION_CACHE_MAX_USERS,
+            max_pages_per_user=settings.CONVERSATION_CACHE_MAX_PAGES_PER_USER,
+            ttl=settings.CONVERSATION_CACHE_TTL,
+        )
+    return _conversation_list_cache
+
+def invalidate_conversation_list(uid: str):
+    cache = get_conversation_list_cache()
+    if cache is not None:
+        cache.invalidate(uid)
+
+def get_conversation_list_cache_stats() -> Dict[str, Any]:
+    cache = get_conversation_list_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
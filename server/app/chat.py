@@ -1,44 +1,103 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from firebase_admin import firestore
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
+import asyncio
 import logging
-from typing import List, Optional
+import hashlib
+from collections import OrderedDict
+from typing import Optional
 from datetime import datetime
 import os
 
-from models import UserProfile, Conversation, Message, NewMessage, UpdateConversationTitle
+from models import UserProfile, Conversation, Message, NewMessage, UpdateConversationTitle, ConversationPage, MessagePage, DeletionStatus, ImageMessageResponse
 from auth import get_current_user
+from config import settings
+from repository import ChatRepository, ConversationNotFoundError, InvalidCursorError
+from blobs import get_blob_store, InvalidBlobError
+from uploads import receive_image_upload
+from services import process_image_with_model
+from metrics import timed_stage
+from ratelimit import rate_limited_user
+from cache import get_conversation_list_cache, invalidate_conversation_list
+from responses import project, dumps, json_response
 
 logger = logging.getLogger(__name__)
-db_firestore = firestore.client()
 
 router = APIRouter()
 
-# Helper function to get user's conversations collection ref
-def get_conversations_ref(uid: str):
-    return db_firestore.collection('users').document(uid).collection('conversations')
+def get_chat_repository(request: Request) -> ChatRepository:
+    """The repository opened in the application lifespan."""
+    repository = getattr(request.app.state, "chat_repository", None)
+    if repository is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Chat history is unavailable: Firebase is not configured.")
+    return repository
 
-# Helper function to get messages collection ref for a specific conversation
-def get_messages_ref(uid: str, conversation_id: str):
-    return get_conversations_ref(uid).document(conversation_id).collection('messages')
+NO_FORMULA_LATEX = "\\text{Không có công thức}"
+OCR_ERROR_LATEX = "\\text{Đã xảy ra lỗi. Vui lòng thử lại.}"
 
-# Endpoint to get all conversations for the current user
-@router.get("/conversations", response_model=List[Conversation])
-async def get_conversations(current_user: UserProfile = Depends(get_current_user)):
+# Background deletions, keyed by (uid, conversation_id); finished entries are evicted oldest first.
+# The durable record is the conversation's 'deleting' flag: a worker that finds a flagged
+# conversation without a job of its own (its worker stopped, or it runs elsewhere) resumes it.
+MAX_TRACKED_DELETIONS = 1000
+_deletion_jobs: "OrderedDict[tuple[str, str], DeletionStatus]" = OrderedDict()
+_deletion_tasks: set[asyncio.Task] = set()
+
+def _conversation_list_etag(items: list, next_cursor: Optional[str]) -> str:
+    # Adding a message moves lastMessageAt and messageCount, renaming changes the title,
+    # and creating or deleting changes the ids; the other fields never change.
+    digest = hashlib.blake2b(digest_size=8)
+    for item in items:
+        digest.update(f"{item['id']}|{item['lastMessageAt']}|{item['messageCount']}|{item['title']}\n".encode("utf-8"))
+    digest.update(f"{next_cursor}".encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+# Endpoint to get the current user's conversations, newest first, one page at a time.
+# Pages are cached per user until one of their conversations changes; the weak ETag
+# lets clients revalidate with If-None-Match and get 304 when nothing changed.
+@router.get("/conversations", response_model=ConversationPage)
+async def get_conversations(
+    request: Request,
+    limit: int = Query(settings.CONVERSATIONS_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
+):
+    cache = get_conversation_list_cache()
+    key = (limit, cursor)
     try:
-        conversations_query = get_conversations_ref(current_user.uid).order_by('lastMessageAt', direction=firestore.Query.DESCENDING)
-        docs = conversations_query.stream()
-        conversations = []
-        for doc in docs:
-            conv_data = doc.to_dict()
-            conversations.append(Conversation(**conv_data))
-        return conversations
+        cached = cache.get(current_user.uid, key) if cache is not None else None
+        if cached is not None:
+            body, etag = cached
+        else:
+            generation = cache.generation() if cache is not None else 0
+            with timed_stage("firestore.list_conversations"):
+                docs, next_cursor = await repository.list_conversations(current_user.uid, limit, cursor)
+            with timed_stage("serialize"):
+                items = []
+                for conv_data in docs:
+                    if conv_data.get("deleting"):
+                        _resume_deletion(repository, current_user.uid, conv_data["id"])
+                        continue # Being deleted in the background
+                    items.append(project(Conversation, conv_data))
+                etag = _conversation_list_etag(items, next_cursor)
+                body = dumps({"items": items, "nextCursor": next_cursor})
+            if cache is not None:
+                cache.set(current_user.uid, key, generation, body, etag)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return json_response(body, headers=headers)
+    except InvalidCursorError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
     except Exception as e:
         logger.error(f"Error retrieving conversations for user {current_user.uid}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve conversations.")
 
 # Endpoint to create a new conversation
 @router.post("/conversations", response_model=Conversation)
-async def create_new_conversation(current_user: UserProfile = Depends(get_current_user)):
+async def create_new_conversation(
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
+):
     try:
         new_conv_id = f"conv_{int(datetime.now().timestamp() * 1000)}_{os.urandom(4).hex()}"
         current_time = int(datetime.now().timestamp() * 1000) # Milliseconds timestamp
@@ -52,7 +111,9 @@ async def create_new_conversation(current_user: UserProfile = Depends(get_curren
             userType='anonymous' if current_user.isAnonymous else 'authenticated'
         )
         
-        get_conversations_ref(current_user.uid).document(new_conv_id).set(conversation_data.model_dump())
+        with timed_stage("firestore.create_conversation"):
+            await repository.create_conversation(current_user.uid, conversation_data.model_dump())
+        invalidate_conversation_list(current_user.uid)
         logger.info(f"Created new conversation {new_conv_id} for user {current_user.uid}")
         return conversation_data
     except Exception as e:
@@ -69,104 +130,323 @@ async def create_new_conversation(current_user: UserProfile = Depends(get_curren
 async def update_conversation_title(
     conversation_id: str,
     update_data: UpdateConversationTitle,
-    current_user: UserProfile = Depends(get_current_user)
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
 ):
     try:
-        conv_ref = get_conversations_ref(current_user.uid).document(conversation_id)
-        conv_doc = conv_ref.get()
-        if not conv_doc.exists:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found.")
-        
-        conv_ref.update({"title": update_data.title})
-        
-        updated_conv_data = conv_doc.to_dict()
-        updated_conv_data["title"] = update_data.title
+        with timed_stage("firestore.update_conversation_title"):
+            updated_conv_data = await repository.update_conversation_title(current_user.uid, conversation_id, update_data.title)
+        invalidate_conversation_list(current_user.uid)
         logger.info(f"Updated conversation {conversation_id} title for user {current_user.uid}")
         return Conversation(**updated_conv_data)
-    except HTTPException:
-        raise
+    except ConversationNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found.")
     except Exception as e:
         logger.error(f"Error updating conversation {conversation_id} title for user {current_user.uid}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update conversation title.")
 
-# Endpoint to delete a conversation and all its messages
+async def _delete_conversation(repository: ChatRepository, uid: str, conversation_id: str, job: Optional[DeletionStatus] = None) -> int:
+    def on_progress(deleted: int):
+        if job is not None:
+            job.deletedMessages = deleted
+
+    try:
+        with timed_stage("firestore.delete_conversation"):
+            return await repository.delete_conversation(
+                uid,
+                conversation_id,
+                batch_size=settings.FIRESTORE_DELETE_BATCH_SIZE,
+                concurrency=settings.FIRESTORE_DELETE_CONCURRENCY,
+                progress=on_progress,
+            )
+    finally:
+        invalidate_conversation_list(uid) # Even a partial deletion may have removed the conversation
+
+async def _run_deletion_job(repository: ChatRepository, uid: str, conversation_id: str, job: DeletionStatus):
+    try:
+        deleted = await _delete_conversation(repository, uid, conversation_id, job)
+        job.status = "completed"
+        logger.info(f"Deleted conversation {conversation_id} and {deleted} messages for user {uid} in the background")
+    except Exception as e:
+        job.status = "failed"
+        logger.error(f"Background deletion of conversation {conversation_id} for user {uid} failed: {e}", exc_info=True)
+
+def _track_deletion_job(key: tuple[str, str], job: DeletionStatus):
+    _deletion_jobs[key] = job
+    _deletion_jobs.move_to_end(key)
+    while len(_deletion_jobs) > MAX_TRACKED_DELETIONS:
+        oldest_key = next((k for k, j in _deletion_jobs.items() if j.status != "running"), None)
+        if oldest_key is None:
+            break
+        del _deletion_jobs[oldest_key]
+
+def _start_deletion_job(repository: ChatRepository, uid: str, conversation_id: str) -> DeletionStatus:
+    job = DeletionStatus(conversationId=conversation_id, status="running")
+    _track_deletion_job((uid, conversation_id), job)
+    task = asyncio.create_task(_run_deletion_job(repository, uid, conversation_id, job))
+    _deletion_tasks.add(task)
+    task.add_done_callback(_deletion_tasks.discard)
+    return job
+
+def _resume_deletion(repository: ChatRepository, uid: str, conversation_id: str) -> DeletionStatus:
+    """
+    Run the deletion of a conversation marked as deleting unless this worker is
+    already running it. Deleting is idempotent, so a job that is also running
+    on another worker only costs duplicate work.
+    """
+    job = _deletion_jobs.get((uid, conversation_id))
+    if job is None or job.status != "running":
+        logger.info(f"Resuming deletion of conversation {conversation_id} for user {uid}")
+        job = _start_deletion_job(repository, uid, conversation_id)
+    return job
+
+async def stop_deletion_jobs():
+    """Cancel unfinished background deletions. Called from the application lifespan; the conversations stay marked as deleting and are resumed the next time their owner lists conversations, on any worker."""
+    for task in list(_deletion_tasks):
+        task.cancel()
+    if _deletion_tasks:
+        await asyncio.gather(*_deletion_tasks, return_exceptions=True)
+
+# Endpoint to delete a conversation and all its messages.
+# With ?background=true the deletion runs as a background job: the conversation is
+# hidden from the list right away and 202 Accepted points at the status endpoint.
 @router.delete("/conversations/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_conversation(
     conversation_id: str,
-    current_user: UserProfile = Depends(get_current_user)
+    request: Request,
+    background: bool = False,
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
 ):
+    key = (current_user.uid, conversation_id)
     try:
-        # Delete all messages in the conversation subcollection
-        messages_ref = get_messages_ref(current_user.uid, conversation_id)
-        docs = messages_ref.stream()
-        for doc in docs:
-            doc.reference.delete()
-        
-        # Delete the conversation document itself
-        get_conversations_ref(current_user.uid).document(conversation_id).delete()
-        logger.info(f"Deleted conversation {conversation_id} and its messages for user {current_user.uid}")
-        return {"message": "Conversation deleted successfully"}
+        if not background:
+            deleted = await _delete_conversation(repository, current_user.uid, conversation_id)
+            logger.info(f"Deleted conversation {conversation_id} and {deleted} messages for user {current_user.uid}")
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+        job = _deletion_jobs.get(key)
+        if job is None or job.status != "running":
+            with timed_stage("firestore.mark_conversation_deleting"):
+                await repository.mark_conversation_deleting(current_user.uid, conversation_id)
+            invalidate_conversation_list(current_user.uid)
+            job = _start_deletion_job(repository, current_user.uid, conversation_id)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=job.model_dump(),
+            headers={"Location": str(request.url_for("get_deletion_status", conversation_id=conversation_id))},
+        )
+    except ConversationNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found.")
     except Exception as e:
         logger.error(f"Error deleting conversation {conversation_id} for user {current_user.uid}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to delete conversation.")
 
-# Endpoint to get messages for a specific conversation
-@router.get("/conversations/{conversation_id}/messages", response_model=List[Message])
+# Endpoint to check on a background deletion started with DELETE ...?background=true.
+# Jobs are tracked per worker; on any other worker, a conversation still marked as
+# deleting reports (and resumes) a running job, and one that is gone answers 404.
+@router.get("/conversations/{conversation_id}/deletion", response_model=DeletionStatus)
+async def get_deletion_status(
+    conversation_id: str,
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
+):
+    job = _deletion_jobs.get((current_user.uid, conversation_id))
+    if job is None:
+        try:
+            with timed_stage("firestore.get_conversation"):
+                conversation = await repository.get_conversation(current_user.uid, conversation_id)
+        except Exception as e:
+            logger.error(f"Error reading conversation {conversation_id} for user {current_user.uid}: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to read deletion status.")
+        if conversation is not None and conversation.get("deleting"):
+            job = _resume_deletion(repository, current_user.uid, conversation_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No deletion in progress for this conversation.")
+    return job
+
+# Endpoint to get messages for a specific conversation: the latest page first,
+# in chronological order; nextCursor fetches the page of older messages
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
 async def get_messages(
     conversation_id: str,
-    current_user: UserProfile = Depends(get_current_user)
+    limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
 ):
     try:
-        messages_query = get_messages_ref(current_user.uid, conversation_id).order_by('timestamp', direction=firestore.Query.ASCENDING)
-        docs = messages_query.stream()
-        messages = []
-        for doc in docs:
-            msg_data = doc.to_dict()
-            messages.append(Message(**msg_data))
-        return messages
+        with timed_stage("firestore.list_messages"):
+            docs, next_cursor = await repository.list_messages(current_user.uid, conversation_id, limit, cursor)
+        with timed_stage("serialize"):
+            # Stored messages were validated when written; project them onto the model's fields instead of validating again
+            messages = [project(Message, msg_data) for msg_data in docs]
+            return json_response({"items": messages, "nextCursor": next_cursor})
+    except InvalidCursorError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
     except Exception as e:
         logger.error(f"Error retrieving messages for conversation {conversation_id} and user {current_user.uid}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve messages.")
 
+async def offload_inline_images(new_message: NewMessage) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Moves base64 'data:' URLs in imageData/preview into the blob store so the
+    message document only keeps a content hash. Returns the (imageData, preview,
+    imageRef) to store; values that are not data URLs are kept as they are.
+    """
+    image_data, preview, image_ref = new_message.imageData, new_message.preview, None
+    blob_store = get_blob_store()
+    if image_data and image_data.startswith("data:"):
+        image_ref = await blob_store.put_data_url(image_data)
+        image_data = None
+    if preview and preview.startswith("data:"):
+        if image_ref is None:
+            image_ref = await blob_store.put_data_url(preview)
+        preview = None # The full image is already stored; the UI renders it in place of the preview
+    return image_data, preview, image_ref
+
+def _new_message_id(timestamp: int) -> str:
+    return f"msg_{timestamp}_{os.urandom(4).hex()}"
+
 # Endpoint to add a new message to a conversation
 @router.post("/conversations/{conversation_id}/messages", response_model=Message)
 async def add_message(
     conversation_id: str,
     new_message: NewMessage,
-    current_user: UserProfile = Depends(get_current_user)
+    current_user: UserProfile = Depends(get_current_user),
+    repository: ChatRepository = Depends(get_chat_repository)
 ):
     try:
-        conv_ref = get_conversations_ref(current_user.uid).document(conversation_id)
-        conv_doc = conv_ref.get()
-        if not conv_doc.exists:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found.")
-        
         current_time = int(datetime.now().timestamp() * 1000)
-        message_id = f"msg_{current_time}_{os.urandom(4).hex()}"
+        message_id = _new_message_id(current_time)
 
+        image_data, preview, image_ref = await offload_inline_images(new_message)
         message_data = Message(
             id=message_id,
             conversationId=conversation_id,
             type=new_message.type,
             content=new_message.content,
             latex=new_message.latex,
-            imageData=new_message.imageData,
-            preview=new_message.preview,
+            imageData=image_data,
+            preview=preview,
+            imageRef=image_ref,
             fileName=new_message.fileName,
             timestamp=current_time
         )
         
-        get_messages_ref(current_user.uid, conversation_id).document(message_id).set(message_data.model_dump())
-        
-        # Update conversation's lastMessageAt and messageCount
-        conv_ref.update({
-            "lastMessageAt": current_time,
-            "messageCount": firestore.Increment(1)
-        })
+        with timed_stage("firestore.add_message"):
+            await repository.add_message(current_user.uid, conversation_id, message_data.model_dump())
+        invalidate_conversation_list(current_user.uid)
         logger.info(f"Added message to conversation {conversation_id} for user {current_user.uid}")
         return message_data
-    except HTTPException:
-        raise
+    except ConversationNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found.")
+    except InvalidBlobError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid image data: {e}")
     except Exception as e:
         logger.error(f"Error adding message to conversation {conversation_id} for user {current_user.uid}: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add message.")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add message.")
+
+# Endpoint to upload an image to a conversation in one round trip: stores the image
+# and the user's message while OCR runs, then stores and returns the bot's reply
+@router.post("/conversations/{conversation_id}/images", response_model=ImageMessageResponse)
+async def add_image_message(
+    conversation_id: str,
+    request: Request,
+    current_user: UserProfile = Depends(rate_limited_user),
+    repository: ChatRepository = Depends(get_chat_repository)
+):
+    with timed_stage("upload"):
+        image = await receive_image_upload(request)
+    try:
+        current_time = int(datetime.now().timestamp() * 1000)
+
+        # Both branches read the spooled upload rather than the whole image in memory
+        async def store_user_message() -> Message:
+            image_ref = await get_blob_store().put_upload(image)
+            user_message = Message(
+                id=_new_message_id(current_time),
+                conversationId=conversation_id,
+                type="user",
+                imageRef=image_ref,
+                fileName=image.filename,
+                timestamp=current_time
+            )
+            with timed_stage("firestore.add_message"):
+                await repository.add_message(current_user.uid, conversation_id, user_message.model_dump())
+            invalidate_conversation_list(current_user.uid)
+            return user_message
+
+        async def run_ocr() -> tuple[Optional[str], Optional[float], bool, Optional[str]]:
+            try:
+                with timed_stage("ocr"):
+                    formula, processing_time, cached = await process_image_with_model(image, user=current_user)
+                return formula, processing_time, cached, None
+            except HTTPException as e:
+                logger.warning(f"OCR failed for conversation {conversation_id} of user {current_user.uid}: {e.detail}")
+                return None, None, False, str(e.detail)
+            except Exception as e:
+                logger.error(f"OCR failed for conversation {conversation_id} of user {current_user.uid}: {e}", exc_info=True)
+                return None, None, False, "Failed to process image."
+
+        ocr_task = asyncio.create_task(run_ocr())
+        try:
+            user_message = await store_user_message()
+        except BaseException:
+            # Without the user's message there is nothing to reply to; give back the OCR capacity
+            ocr_task.cancel()
+            await asyncio.gather(ocr_task, return_exceptions=True)
+            raise
+        formula, processing_time, cached, error = await ocr_task
+
+        if error is not None:
+            latex = OCR_ERROR_LATEX
+        else:
+            latex = formula or NO_FORMULA_LATEX
+        bot_time = max(int(datetime.now().timestamp() * 1000), current_time + 1) # Always sorts after the user's message
+        bot_message = Message(
+            id=_new_message_id(bot_time),
+            conversationId=conversation_id,
+            type="bot",
+            latex=latex,
+            timestamp=bot_time
+        )
+        with timed_stage("firestore.add_message"):
+            await repository.add_message(current_user.uid, conversation_id, bot_message.model_dump())
+        invalidate_conversation_list(current_user.uid)
+        logger.info(f"Added image and reply to conversation {conversation_id} for user {current_user.uid}")
+        return ImageMessageResponse(
+            userMessage=user_message,
+            botMessage=bot_message,
+            processing_time=processing_time,
+            cached=cached,
+            error=error
+        )
+    except ConversationNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found.")
+    except Exception as e:
+        logger.error(f"Error adding image to conversation {conversation_id} for user {current_user.uid}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add image message.")
+    finally:
+        image.close()
+
+# Endpoint to serve a stored image by its content hash
+@router.get("/blobs/{blob_hash}")
+async def get_blob(
+    blob_hash: str,
+    request: Request,
+    current_user: UserProfile = Depends(get_current_user)
+):
+    # The hash is the content, so the ETag is strong and the response never changes
+    etag = f'"{blob_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    try:
+        blob = await get_blob_store().get(blob_hash)
+    except Exception as e:
+        logger.error(f"Error reading blob {blob_hash} for user {current_user.uid}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to read image.")
+    if blob is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found.")
+    return Response(content=blob.data, media_type=blob.content_type, headers=headers)
\ No newline at end of file
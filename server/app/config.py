@@ -18,12 +18,130 @@ class Settings(BaseSettings):
     FIREBASE_SERVICE_ACCOUNT_KEY_JSON: Optional[str] = None
     FIREBASE_SERVICE_ACCOUNT_KEY_PATH: str = "firebase_admin_key.json"
 
+    # Firebase ID token verification
+    AUTH_TOKEN_CACHE_ENABLED: bool = True
+    AUTH_TOKEN_CACHE_MAX_ENTRIES: int = 10000 # entries also expire at each token's 'exp'
+    AUTH_VERIFY_WORKERS: int = 4 # threads for signature checks and certificate fetches
+    AUTH_CERT_REFRESH_INTERVAL: int = 600 # seconds between background certificate refreshes
+
+    # Chat history pagination
+    CONVERSATIONS_PAGE_SIZE: int = 30
+    MESSAGES_PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 200
+
+    # Startup
+    STARTUP_WARM_UP_TIMEOUT: float = 10.0 # seconds; /ready waits for warm-up to finish or give up, then checks Firebase and the Model API
+
+    # Conversation deletion
+    FIRESTORE_DELETE_BATCH_SIZE: int = 500 # writes per batch commit (Firestore allows at most 500)
+    FIRESTORE_DELETE_CONCURRENCY: int = 4 # batch commits in flight at once per deletion
+
+    # Content-addressed storage for message images
+    BLOB_STORE_BACKEND: str = "local" # "local" or "gcs"
+    BLOB_STORE_DIR: str = "blobs" # used by the "local" backend
+    BLOB_STORE_BUCKET: Optional[str] = None # used by the "gcs" backend; defaults to the Firebase storageBucket
+    BLOB_STORE_PREFIX: str = "blobs/" # object name prefix in the bucket
+
     # Model API Backend Configuration
-    MODEL_API_BASE_URL: str = os.getenv("MODEL_API_BASE_URL") # Default to local model API
+    MODEL_API_BASE_URL: Optional[str] = None # single Model API endpoint; see MODEL_API_BASE_URLS for several
     MODEL_API_KEY: Optional[str] = os.getenv("MODEL_API_KEY") # API Key for Model API Backend
+    MODEL_API_BASE_URLS: Optional[str] = None # comma-separated Model API endpoints; overrides MODEL_API_BASE_URL
+    MODEL_API_LB_STRATEGY: str = "ewma" # "ewma" (latency EWMA x requests in flight) or "least_outstanding"
+    MODEL_API_LB_EWMA_ALPHA: float = 0.3 # weight of the newest latency sample
+    MODEL_API_HEALTH_PATH: Optional[str] = "/health" # probed on every endpoint; empty disables health checks
+    MODEL_API_HEALTH_INTERVAL: float = 5.0 # seconds between probes
+    MODEL_API_HEALTH_TIMEOUT: float = 2.0 # seconds
+    MODEL_API_HEALTH_EJECT_AFTER: int = 2 # consecutive failed probes before an endpoint stops receiving traffic
+    MODEL_API_HEALTH_READMIT_AFTER: int = 2 # consecutive good probes before it is used again
 
     # HTTP client timeout for Model API calls
     MODEL_API_TIMEOUT: int = 30 # seconds
+    # Per-phase timeouts; each falls back to MODEL_API_TIMEOUT when unset
+    MODEL_API_CONNECT_TIMEOUT: Optional[float] = 5.0 # seconds
+    MODEL_API_READ_TIMEOUT: Optional[float] = None # seconds
+    MODEL_API_WRITE_TIMEOUT: Optional[float] = 10.0 # seconds
+    MODEL_API_POOL_TIMEOUT: Optional[float] = 5.0 # seconds, wait for a free pooled connection
+
+    # Shared HTTP client connection pool for Model API calls
+    MODEL_API_MAX_CONNECTIONS: int = 100
+    MODEL_API_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    MODEL_API_KEEPALIVE_EXPIRY: float = 30.0 # seconds an idle connection is kept open
+    MODEL_API_HTTP2: bool = False # Requires the 'h2' package (httpx[http2])
+
+    # Micro-batching: queue images for a short window and send them as one batch request
+    MODEL_API_BATCHING_ENABLED: bool = False
+    MODEL_API_BATCH_PATH: str = "/predict/batch" # relative to MODEL_API_BASE_URL
+    MODEL_API_BATCH_MAX_SIZE: int = 8 # images per batch request
+    MODEL_API_BATCH_WINDOW_MS: float = 10.0 # how long to wait for more images before sending
+    MODEL_API_BATCH_QUEUE_SIZE: int = 256 # pending images before new requests are rejected with 503
+    MODEL_API_BATCH_REQUEST_TIMEOUT: float = 30.0 # seconds a caller waits, including time in the queue
+
+    # Resilience around Model API calls
+    MODEL_API_BREAKER_ENABLED: bool = True
+    MODEL_API_BREAKER_FAILURE_THRESHOLD: int = 5 # consecutive failures of an endpoint that open its circuit
+    MODEL_API_BREAKER_RECOVERY_TIMEOUT: float = 30.0 # seconds the circuit stays open before a trial call
+    MODEL_API_MAX_RETRIES: int = 2 # retries after 502/503/504 answers and connection errors, not timeouts; 0 disables retries
+    MODEL_API_RETRY_BASE_DELAY: float = 0.1 # seconds; backoff is full-jitter exponential
+    MODEL_API_RETRY_MAX_DELAY: float = 2.0 # seconds
+    MODEL_API_RETRY_BUDGET_RATIO: float = 0.2 # extra attempts (retries and hedges) allowed per request
+    MODEL_API_RETRY_BUDGET_MIN_PER_SECOND: float = 1.0 # extra attempts always allowed, regardless of traffic
+    MODEL_API_HEDGING_ENABLED: bool = False # send a second request when the first is slower than usual
+    MODEL_API_HEDGE_PERCENTILE: float = 95.0 # hedge after this percentile of recent latencies
+    MODEL_API_HEDGE_MIN_DELAY: float = 0.05 # seconds
+    MODEL_API_LIMITER_ENABLED: bool = True # adaptive (AIMD) cap on concurrent Model API calls
+    MODEL_API_LIMITER_INITIAL: int = 50
+    MODEL_API_LIMITER_MIN: int = 1
+    MODEL_API_LIMITER_MAX: int = 200
+    MODEL_API_LIMITER_LATENCY_TARGET: float = 10.0 # seconds; slower calls count as congestion
+    MODEL_API_LIMITER_BACKOFF: float = 0.9 # multiplicative decrease on congestion
+
+    # Streaming OCR over the /ws/ocr WebSocket
+    MODEL_API_STREAM_PATH: Optional[str] = None # e.g. "/predict/stream"; NDJSON token stream, relative to MODEL_API_BASE_URL
+    WS_AUTH_TIMEOUT: float = 10.0 # seconds a new connection has to send its auth message
+    WS_MAX_JOBS_PER_CONNECTION: int = 8 # images in flight at once on one connection
+
+    # Image uploads
+    MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024 # larger uploads are rejected with 413
+    UPLOAD_SPOOL_MAX_MEMORY: int = 1024 * 1024 # uploads above this size are spooled to disk
+
+    # Image preprocessing before OCR (requires Pillow); runs in a process pool
+    IMAGE_PREPROCESS_ENABLED: bool = False
+    IMAGE_PREPROCESS_MAX_SIDE: int = 1280 # longest side in pixels after downscaling
+    IMAGE_PREPROCESS_FORMAT: str = "PNG" # "PNG" or "WEBP" (both lossless)
+    IMAGE_PREPROCESS_GRAYSCALE: bool = True
+    IMAGE_PREPROCESS_WORKERS: int = 2
+
+    # LaTeX result cache keyed by image content hash
+    LATEX_CACHE_ENABLED: bool = True
+    LATEX_CACHE_MAX_ENTRIES: int = 2048 # in-process LRU capacity
+    LATEX_CACHE_TTL: int = 7 * 24 * 3600 # seconds
+    LATEX_CACHE_BACKEND: str = "memory" # "memory", "disk" or "redis" (shared second tier)
+    LATEX_CACHE_DIR: str = ".latex_cache" # used by the "disk" backend
+    LATEX_CACHE_REDIS_URL: Optional[str] = None # used by the "redis" backend, e.g. redis://localhost:6379/0
+
+    # Per-user rate limits on OCR requests (token bucket keyed by uid)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory" # "memory" (per process) or "redis" (shared by all workers)
+    RATE_LIMIT_REDIS_URL: Optional[str] = None # used by the "redis" backend, e.g. redis://localhost:6379/0
+    RATE_LIMIT_ANONYMOUS_PER_MINUTE: float = 10.0 # sustained OCR requests per minute for anonymous users
+    RATE_LIMIT_ANONYMOUS_BURST: int = 5 # requests allowed back to back before the rate applies
+    RATE_LIMIT_AUTHENTICATED_PER_MINUTE: float = 60.0
+    RATE_LIMIT_AUTHENTICATED_BURST: int = 20
+    RATE_LIMIT_MAX_USERS: int = 100000 # buckets kept by the "memory" backend; idle users are evicted first
+
+    # Fair sharing of Model API capacity between users
+    FAIR_QUEUE_ENABLED: bool = True
+    FAIR_QUEUE_CONCURRENCY: int = 32 # OCR calls in flight at once; beyond this, users take turns
+    FAIR_QUEUE_MAX_WAITING_PER_USER: int = 16 # queued OCR calls per user before new ones get 429
+    FAIR_QUEUE_WEIGHT_ANONYMOUS: int = 1 # calls granted per turn
+    FAIR_QUEUE_WEIGHT_AUTHENTICATED: int = 2
+
+    # Conversation list responses
+    CONVERSATION_CACHE_ENABLED: bool = True
+    CONVERSATION_CACHE_TTL: int = 30 # seconds; the cache is per process, so this bounds staleness after a write on another worker
+    CONVERSATION_CACHE_MAX_USERS: int = 10000 # least recently used users are evicted first
+    CONVERSATION_CACHE_MAX_PAGES_PER_USER: int = 8 # (limit, cursor) pages kept per user; least recently used are evicted first
+    COMPRESSION_MINIMUM_SIZE: int = 1024 # bytes; smaller JSON responses are sent uncompressed
 
     # Pydantic Settings management
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
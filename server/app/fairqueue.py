@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(HTTPException):
+    """A user already has as many calls waiting as the queue allows."""
+
+    def __init__(self, key: str):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many images waiting to be processed. Please wait for the previous ones.",
+            headers={"Retry-After": "1"}
+        )
+        self.key = key
+
+class FairQueue:
+    """
+    Weighted round-robin admission for upstream OCR calls.
+
+    Up to `concurrency` calls run at once. Beyond that every user waits in their
+    own FIFO, and each freed slot goes to the user whose turn it is; a user is
+    granted up to `weight` calls per turn before moving to the back of the
+    rotation. A user with a deep backlog therefore delays anyone else by at most
+    one round, instead of everyone queueing behind them in arrival order.
+    """
+
+    def __init__(self, concurrency: int, max_waiting_per_user: int):
+        self.concurrency = concurrency
+        self.max_waiting_per_user = max_waiting_per_user
+        self.active = 0
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict() # rotation order
+        self._weights: Dict[str, int] = {}
+        self._turn_grants: Dict[str, int] = {} # grants left in the current turn of the user at the front
+        self.immediate = 0
+        self.queued = 0
+        self.rejected = 0
+
+    async def acquire(self, key: str, weight: int = 1):
+        if self.active < self.concurrency and not self._waiting:
+            self.active += 1
+            self.immediate += 1
+            return
+
+        waiters = self._waiting.get(key)
+        if waiters is not None and len(waiters) >= self.max_waiting_per_user:
+            self.rejected += 1
+            raise QueueFullError(key)
+        if waiters is None:
+            waiters = self._waiting[key] = deque()
+        self._weights[key] = max(1, weight)
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # Granted a slot just as the caller went away; hand it on
+            else:
+                waiters.remove(future)
+                if not waiters:
+                    self._forget(key)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _forget(self, key: str):
+        self._waiting.pop(key, None)
+        self._weights.pop(key, None)
+        self._turn_grants.pop(key, None)
+
+    def _dispatch(self):
+        while self.active < self.concurrency and self._waiting:
+            key, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            grants_left = self._turn_grants.get(key, self._weights[key]) - 1
+            if not waiters:
+                self._forget(key)
+            elif grants_left <= 0:
+                self._turn_grants.pop(key, None)
+                self._waiting.move_to_end(key) # Turn over; back of the rotation
+            else:
+                self._turn_grants[key] = grants_left
+            self.active += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": sum(len(waiters) for waiters in self._waiting.values()),
+            "waiting_users": len(self._waiting),
+            "immediate": self.immediate,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,108 @@
+import asyncio
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow is only needed when IMAGE_PREPROCESS_ENABLED is set
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Magic numbers of the formats the Model API is likely to receive
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/bmp": "bmp",
+    "image/tiff": "tiff",
+    "image/webp": "webp",
+}
+
+def sniff_content_type(image_data: bytes, default: str = "image/png") -> str:
+    """Detect an image's content type from its leading bytes."""
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in _SIGNATURES:
+        if image_data.startswith(signature):
+            return content_type
+    return default
+
+def filename_for(content_type: str) -> str:
+    return f"image.{_EXTENSIONS.get(content_type, 'png')}"
+
+def normalize_image(image_data: bytes, max_side: int, output_format: str, grayscale: bool) -> bytes:
+    """
+    Decode an image, apply its EXIF orientation, optionally convert it to grayscale,
+    downscale it to fit within max_side x max_side and re-encode it losslessly.
+    The same input always produces the same bytes, so the output is usable as a cache key.
+    Runs in a worker process.
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        # Let the JPEG decoder skip detail we are going to throw away anyway
+        img.draft("L" if grayscale else "RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        if grayscale:
+            img = img.convert("L")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        if output_format == "WEBP":
+            img.save(output, format="WEBP", lossless=True, method=4)
+        else:
+            img.save(output, format="PNG", optimize=True)
+        return output.getvalue()
+
+# --- Process pool ---
+_image_pool: Optional[ProcessPoolExecutor] = None
+
+def start_image_pool():
+    """Start the preprocessing worker processes when preprocessing is enabled. Called from the application lifespan."""
+    global _image_pool
+    if not settings.IMAGE_PREPROCESS_ENABLED or _image_pool is not None:
+        return
+    if Image is None:
+        logger.warning("IMAGE_PREPROCESS_ENABLED is set but Pillow is not installed. Images will be sent unmodified.")
+        return
+    _image_pool = ProcessPoolExecutor(max_workers=settings.IMAGE_PREPROCESS_WORKERS)
+    logger.info(f"Image preprocessing pool started with {_image_pool._max_workers} workers.")
+
+def stop_image_pool():
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=True, cancel_futures=True)
+        _image_pool = None
+        logger.info("Image preprocessing pool stopped.")
+
+def preprocessing_enabled() -> bool:
+    return _image_pool is not None
+
+async def normalize_image_async(image_data: bytes) -> bytes:
+    """Normalize an image in the process pool without blocking the event loop."""
+    output_format = settings.IMAGE_PREPROCESS_FORMAT.upper()
+    return await asyncio.get_running_loop().run_in_executor(
+        _image_pool,
+        normalize_image,
+        image_data,
+        settings.IMAGE_PREPROCESS_MAX_SIDE,
+        output_format,
+        settings.IMAGE_PREPROCESS_GRAYSCALE,
+    )
@@ -1,25 +1,85 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
+import time
 
-from auth import router as auth_router, verify_firebase_id_token, get_current_user
-from chat import router as chat_router
+from auth import (
+    router as auth_router, verify_firebase_id_token, initialize_firebase, is_firebase_initialized,
+    refresh_certificates, start_certificate_refresh, stop_certificate_refresh, get_token_cache_stats
+)
+from chat import router as chat_router, stop_deletion_jobs
+from repository import create_chat_repository
+from realtime import router as realtime_router
 from models import UserProfile, Message
-from services import process_image_with_model 
+from services import (
+    process_image_with_model, warm_up_model_api, model_api_reachable, close_model_client,
+    start_batch_dispatcher, stop_batch_dispatcher,
+    get_model_pool_stats, get_single_flight_stats, get_batching_stats, get_resilience_stats, get_fair_queue_stats
+)
+from uploads import receive_image_upload
+from imaging import start_image_pool, stop_image_pool
+from cache import close_latex_cache, get_latex_cache_stats, get_conversation_list_cache_stats
+from compression import CompressionMiddleware
+from ratelimit import rate_limited_user, close_rate_limiter, get_rate_limit_stats
+from metrics import MetricsMiddleware, render_metrics, timed_stage
 from config import settings
 
-load_dotenv()
-
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+async def _warm_up(app: FastAPI):
+    """Fetch token signing certificates, open the Model API clients and connections and the Firestore channel, all at once."""
+    started = time.perf_counter()
+    steps = {"certificates": refresh_certificates(), "model_api": warm_up_model_api()}
+    if app.state.chat_repository is not None:
+        steps["firestore"] = app.state.chat_repository.warm_up()
+    results = await asyncio.gather(
+        *(asyncio.wait_for(step, settings.STARTUP_WARM_UP_TIMEOUT) for step in steps.values()),
+        return_exceptions=True
+    )
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Warm-up step '{name}' failed: {result!r}")
+    app.state.ready = True # /ready still checks that the required dependencies are up
+    logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open long-lived resources on startup and release them on shutdown. Nothing
+    connects at import time; the app starts serving right away and warms up in
+    the background, reporting ready on /ready once that is done.
+    """
+    app.state.ready = False
+    firebase_initialized = await asyncio.to_thread(initialize_firebase)
+    if getattr(app.state, "chat_repository", None) is None: # Tests and benchmarks may inject their own
+        app.state.chat_repository = create_chat_repository() if firebase_initialized else None
+    await start_batch_dispatcher()
+    start_image_pool()
+    start_certificate_refresh()
+    warm_up = asyncio.create_task(_warm_up(app))
+    try:
+        yield
+    finally:
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+        await stop_deletion_jobs()
+        await stop_certificate_refresh()
+        stop_image_pool()
+        await stop_batch_dispatcher()
+        await close_model_client()
+        await close_latex_cache()
+        await close_rate_limiter()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.API_VERSION,
-    description=settings.PROJECT_DESCRIPTION
+    description=settings.PROJECT_DESCRIPTION,
+    lifespan=lifespan
 )
 
 # CORS Middleware (Adjust allow_origins for production)
@@ -29,11 +89,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag"], # Let the frontend read per-stage timings and revalidate lists
 )
 
+# Compress large JSON responses (conversation and message lists)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+
+# Added last so it is outermost: request latency covers CORS handling too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(chat_router, prefix="/chat", tags=["Chat"]) # Chat endpoints for conversations and messages
+app.include_router(realtime_router, tags=["Realtime"]) # WebSocket /ws/ocr for streamed OCR progress
 
 @app.get("/", summary="Root endpoint for API health check")
 async def root():
@@ -44,11 +112,47 @@ async def health_check():
     """Simple health check endpoint."""
     return {"status": "healthy", "timestamp": os.getenv("START_TIME", "N/A")}
 
+@app.get("/ready", summary="Readiness check endpoint")
+async def readiness_check(request: Request):
+    """
+    503 until startup warm-up has finished, and afterwards while a required
+    dependency is known to be down: Firebase did not initialize (no sign-in or
+    chat history) or no Model API endpoint answered its latest health probe.
+    /health only says the process is up.
+    """
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    dependencies = {"firebase": is_firebase_initialized(), "model_api": model_api_reachable()}
+    if not all(dependencies.values()):
+        return JSONResponse(status_code=503, content={"status": "unavailable", "dependencies": dependencies})
+    return {"status": "ready"}
+
+@app.get("/stats", summary="Runtime statistics")
+async def runtime_stats():
+    """Connection pool, cache, request coalescing, batching, resilience, rate limit and fair queue statistics for the OCR pipeline, plus token cache counters."""
+    return {
+        "token_cache": get_token_cache_stats(),
+        "model_api_pool": get_model_pool_stats(),
+        "latex_cache": get_latex_cache_stats(),
+        "conversation_cache": get_conversation_list_cache_stats(),
+        "single_flight": get_single_flight_stats(),
+        "batching": get_batching_stats(),
+        "resilience": get_resilience_stats(),
+        "rate_limit": get_rate_limit_stats(),
+        "fair_queue": get_fair_queue_stats(),
+    }
+
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def metrics():
+    """Request latency histograms per route, per-stage timers, upstream counters and upload sizes."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Image processing endpoint
 @app.post("/process-image")
 async def process_image_endpoint(
     request: Request,
-    user: UserProfile = Depends(get_current_user) # Ensure user is authenticated
+    user: UserProfile = Depends(rate_limited_user) # Ensure user is authenticated and within their rate limit
 ):
     """
     Receives an image from the frontend, sends it to the Model API Backend,
@@ -56,32 +160,28 @@ async def process_image_endpoint(
     """
     if not user.uid:
         raise HTTPException(status_code=401, detail="Authentication required for image processing.")
-    
-    content_type = request.headers.get("Content-Type")
-    if not content_type or not content_type.startswith("multipart/form-data"):
-        raise HTTPException(status_code=400, detail="Invalid Content-Type. Expected multipart/form-data.")
 
+    # Stream the upload into a spooled file instead of buffering the whole form in memory
+    with timed_stage("upload"):
+        image = await receive_image_upload(request)
     try:
-        form = await request.form()
-        image_file = form.get("image")
-        if not image_file or not hasattr(image_file, 'file'):
-            raise HTTPException(status_code=400, detail="No image file provided.")
-
-        image_data = await image_file.read()
-        
         # Call the service layer to process image with the Model API Backend
-        latex_formula, processing_time = await process_image_with_model(image_data)
+        with timed_stage("ocr"):
+            latex_formula, processing_time, cached = await process_image_with_model(image, user=user)
         
         return {
             "formula": latex_formula,
             "processing_time": processing_time,
-            "user_uid": user.uid
+            "user_uid": user.uid,
+            "cached": cached
         }
     except HTTPException:
         raise # Re-raise FastAPI HTTPExceptions
     except Exception as e:
         logger.error(f"Error processing image: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to process image: {e}")
+    finally:
+        image.close()
 
 if __name__ == "__main__":
     import uvicorn
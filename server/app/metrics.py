@@ -0,0 +1,134 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError: # prometheus-client is optional; without it only Server-Timing is emitted
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+# Per-request stage timings, collected for the Server-Timing header: name -> [total seconds, calls]
+_request_stages: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_stages", default=None)
+
+if prometheus_client is not None:
+    REGISTRY = prometheus_client.CollectorRegistry()
+    HTTP_REQUESTS = Counter(
+        "http_requests_total", "HTTP requests by route and status code.",
+        ["method", "route", "status"], registry=REGISTRY,
+    )
+    HTTP_REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "HTTP request latency by route, until the response is fully sent.",
+        ["method", "route"], registry=REGISTRY,
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    )
+    HTTP_REQUESTS_IN_FLIGHT = Gauge(
+        "http_requests_in_flight", "HTTP requests currently being served.", registry=REGISTRY,
+    )
+    STAGE_DURATION = Histogram(
+        "stage_duration_seconds", "Time spent in one stage of a request (auth, Firestore calls, OCR, upload parsing).",
+        ["stage"], registry=REGISTRY,
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    )
+    UPSTREAM_RESPONSES = Counter(
+        "model_api_responses_total", "Model API calls by endpoint and outcome (status code, 'error' or 'rejected').",
+        ["endpoint", "outcome"], registry=REGISTRY,
+    )
+    UPSTREAM_IN_FLIGHT = Gauge(
+        "model_api_requests_in_flight", "Model API calls currently outstanding, by endpoint.",
+        ["endpoint"], registry=REGISTRY,
+    )
+    UPLOAD_SIZE = Histogram(
+        "upload_size_bytes", "Size of uploaded images.",
+        ["source"], registry=REGISTRY,
+        buckets=tuple(1024 * 4 ** i for i in range(8)), # 1 KiB .. 16 MiB
+    )
+
+@contextmanager
+def timed_stage(name: str):
+    """Time a block as one stage of the current request, e.g. `with timed_stage("auth"): ...`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stages = _request_stages.get()
+        if stages is not None:
+            totals = stages.setdefault(name, [0.0, 0])
+            totals[0] += elapsed
+            totals[1] += 1
+        if prometheus_client is not None:
+            STAGE_DURATION.labels(name).observe(elapsed)
+
+def observe_upload_size(source: str, size: int):
+    if prometheus_client is not None:
+        UPLOAD_SIZE.labels(source).observe(size)
+
+def record_upstream_outcome(endpoint: str, outcome: str):
+    if prometheus_client is not None:
+        UPSTREAM_RESPONSES.labels(endpoint, outcome).inc()
+
+def track_upstream_in_flight(endpoint: str, delta: int):
+    if prometheus_client is not None:
+        UPSTREAM_IN_FLIGHT.labels(endpoint).inc(delta)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """The Prometheus text exposition of all metrics, and its content type."""
+    if prometheus_client is None:
+        return b"# prometheus-client is not installed\n", "text/plain; charset=utf-8"
+    return prometheus_client.generate_latest(REGISTRY), prometheus_client.CONTENT_TYPE_LATEST
+
+def _server_timing(stages: Dict[str, List[float]], total: float) -> bytes:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in stages.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries).encode("latin-1")
+
+class MetricsMiddleware:
+    """
+    Records per-route request counts and latency, and adds a Server-Timing header
+    listing the stages timed with timed_stage() while the request was handled.
+    The route label is the matched path template (e.g. /chat/conversations/{conversation_id}),
+    so label cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stages: Dict[str, List[float]] = {}
+        token = _request_stages.set(stages)
+        status_code = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stages, time.perf_counter() - started)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        if prometheus_client is not None:
+            HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
+            if prometheus_client is not None:
+                HTTP_REQUESTS_IN_FLIGHT.dec()
+                route = scope.get("route")
+                route_label = getattr(route, "path", None) or "unmatched"
+                method = scope["method"]
+                HTTP_REQUESTS.labels(method, route_label, str(status_code)).inc()
+                HTTP_REQUEST_DURATION.labels(method, route_label).observe(time.perf_counter() - started)
@@ -22,6 +22,7 @@ class NewMessage(MessageBase):
     pass
 
 class Message(MessageBase):
+    imageRef: Optional[str] = None # SHA-256 of the image in the blob store, served by GET /chat/blobs/{imageRef}
     id: str
     conversationId: str
     timestamp: int
@@ -34,6 +35,30 @@ class Conversation(BaseModel):
     lastMessageAt: int
     messageCount: int = 0
     userType: str
+    deleting: bool = False # set while a background deletion is in progress
+
+# Paginated responses; pass nextCursor back as ?cursor= to fetch the following page
+class ConversationPage(BaseModel):
+    items: List[Conversation]
+    nextCursor: Optional[str] = None
+
+class MessagePage(BaseModel):
+    items: List[Message]
+    nextCursor: Optional[str] = None
+
+# Result of uploading an image to a conversation: the stored user message and the bot's reply
+class ImageMessageResponse(BaseModel):
+    userMessage: Message
+    botMessage: Message
+    processing_time: Optional[float] = None
+    cached: bool = False
+    error: Optional[str] = None # set when OCR failed; botMessage then carries the error text
+
+# Progress of a background conversation deletion
+class DeletionStatus(BaseModel):
+    conversationId: str
+    status: str # "running", "completed" or "failed"
+    deletedMessages: int = 0
 
 # Update Conversation Title
 class UpdateConversationTitle(BaseModel):
@@ -47,4 +72,5 @@ class ImageProcessRequest(BaseModel):
 class ImageProcessResponse(BaseModel):
     formula: str
     processing_time: float
-    user_uid: str
\ No newline at end of file
+    user_uid: str
+    cached: bool = False
\ No newline at end of file
@@ -0,0 +1,164 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+
+from auth import get_current_user
+from config import settings
+from models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# --- Token bucket backends: acquire() takes one token and returns 0, or the seconds until one is available ---
+class MemoryRateLimitBackend:
+    """Token buckets in an LRU dict; limits are per process."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict() # key -> (tokens, updated)
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(burst), now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False) # An evicted user starts again with a full bucket
+        return wait
+
+    async def close(self):
+        pass
+
+# Refill and take a token atomically on the server, using the server's clock so
+# every worker agrees on time. The wait is returned as a string: Lua numbers
+# would be truncated to integers in the reply.
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+class RedisRateLimitBackend:
+    """Token buckets in any Redis-protocol server, shared by all workers; one Lua script call per request."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis_asyncio # Optional dependency
+        self.client = redis_asyncio.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(_TOKEN_BUCKET_LUA)
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._script(keys=[self.prefix + key], args=[rate, burst]))
+
+    async def close(self):
+        await self.client.aclose()
+
+class RateLimiter:
+    """
+    Per-user token buckets with separate rates for anonymous and signed-in users.
+    If the backend fails the request is let through: an unreachable Redis should
+    not take OCR down with it.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    def _limits(self, user: UserProfile) -> Tuple[float, int]:
+        if user.isAnonymous:
+            return settings.RATE_LIMIT_ANONYMOUS_PER_MINUTE / 60, settings.RATE_LIMIT_ANONYMOUS_BURST
+        return settings.RATE_LIMIT_AUTHENTICATED_PER_MINUTE / 60, settings.RATE_LIMIT_AUTHENTICATED_BURST
+
+    async def check(self, user: UserProfile):
+        """Take one request from the user's bucket; raises 429 with Retry-After when it is empty."""
+        rate, burst = self._limits(user)
+        try:
+            wait = await self.backend.acquire(user.uid, rate, burst)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Rate limit backend failed, allowing request: {e}")
+            return
+        if wait > 0:
+            self.limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many image requests. Please slow down.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+        self.allowed += 1
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "errors": self.errors,
+        }
+
+def _create_backend():
+    backend = settings.RATE_LIMIT_BACKEND.lower()
+    if backend == "redis":
+        if not settings.RATE_LIMIT_REDIS_URL:
+            logger.warning("RATE_LIMIT_BACKEND is 'redis' but RATE_LIMIT_REDIS_URL is not set. Using per-process limits.")
+        else:
+            try:
+                return RedisRateLimitBackend(settings.RATE_LIMIT_REDIS_URL)
+            except ImportError:
+                logger.warning("RATE_LIMIT_BACKEND is 'redis' but the 'redis' package is not installed. Using per-process limits.")
+    elif backend != "memory":
+        logger.warning(f"Unknown RATE_LIMIT_BACKEND '{settings.RATE_LIMIT_BACKEND}'. Using per-process limits.")
+    return MemoryRateLimitBackend(settings.RATE_LIMIT_MAX_USERS)
+
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Returns the process-wide OCR rate limiter, or None when rate limiting is disabled."""
+    global _rate_limiter
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(_create_backend())
+    return _rate_limiter
+
+async def close_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is not None:
+        await _rate_limiter.close()
+        _rate_limiter = None
+
+def get_rate_limit_stats() -> Dict:
+    return _rate_limiter.stats() if _rate_limiter is not None else {"enabled": settings.RATE_LIMIT_ENABLED}
+
+async def rate_limited_user(user: UserProfile = Depends(get_current_user)) -> UserProfile:
+    """Dependency for OCR endpoints: the current user, after taking a token from their bucket."""
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        await limiter.check(user)
+    return user
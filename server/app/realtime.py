@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Any, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+
+from auth import verify_id_token_cached, get_current_user
+from config import settings
+from metrics import observe_upload_size
+from models import UserProfile
+from services import process_image_with_model
+from ratelimit import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Close codes in the 4000-4999 range reserved for applications
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_BAD_REQUEST = 4400
+
+class OcrConnection:
+    """
+    One client's WebSocket. Any number of images can be submitted over it; each
+    runs as its own task and reports events tagged with the client's job id, so
+    the results arrive in completion order rather than submission order.
+    """
+
+    def __init__(self, websocket: WebSocket, user: UserProfile):
+        self.websocket = websocket
+        self.user = user
+        self.jobs: Dict[str, asyncio.Task] = {}
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, event: str, job_id: Optional[str] = None, **payload):
+        if self.closed:
+            return # A job's upstream call can outlive the socket; there is nobody left to tell
+        message = {"type": event, **payload}
+        if job_id is not None:
+            message["id"] = job_id
+        async with self._send_lock: # Job tasks share the socket; keep frames from interleaving
+            await self.websocket.send_json(message)
+
+    async def _run_job(self, job_id: str, image_data: bytes):
+        async def progress(event: str, payload: Dict[str, Any]):
+            await self.send(event, job_id, **payload)
+
+        try:
+            formula, processing_time, cached = await process_image_with_model(image_data, progress=progress, user=self.user)
+            await self.send("result", job_id, formula=formula, processing_time=processing_time, cached=cached)
+        except HTTPException as e:
+            await self.send("error", job_id, status=e.status_code, detail=e.detail)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing image {job_id} for user {self.user.uid}: {e}", exc_info=True)
+            await self.send("error", job_id, status=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to process image.")
+        finally:
+            self.jobs.pop(job_id, None)
+
+    async def submit(self, job_id: str, image_data: bytes):
+        if job_id in self.jobs:
+            await self.send("error", job_id, status=status.HTTP_409_CONFLICT, detail="A job with this id is already running.")
+            return
+        if len(self.jobs) >= settings.WS_MAX_JOBS_PER_CONNECTION:
+            await self.send("error", job_id, status=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many images in flight on this connection.")
+            return
+        if not image_data:
+            await self.send("error", job_id, status=status.HTTP_400_BAD_REQUEST, detail="No image file provided.")
+            return
+        if len(image_data) > settings.MAX_UPLOAD_BYTES:
+            await self.send(
+                "error", job_id,
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image is too large. Maximum upload size is {settings.MAX_UPLOAD_BYTES / (1024 * 1024):.1f} MB."
+            )
+            return
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            try:
+                await limiter.check(self.user)
+            except HTTPException as e:
+                await self.send("error", job_id, status=e.status_code, detail=e.detail, retry_after=int(e.headers["Retry-After"]))
+                return
+        observe_upload_size("websocket", len(image_data))
+        await self.send("queued", job_id)
+        self.jobs[job_id] = asyncio.create_task(self._run_job(job_id, image_data))
+
+    async def close(self):
+        self.closed = True
+        for task in list(self.jobs.values()):
+            task.cancel()
+        if self.jobs:
+            await asyncio.gather(*self.jobs.values(), return_exceptions=True)
+
+async def _authenticate(websocket: WebSocket) -> Optional[UserProfile]:
+    """Browsers cannot set headers on a WebSocket, so the ID token comes in the first message."""
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_AUTH_TIMEOUT)
+        if message.get("type") != "auth" or not message.get("token"):
+            return None
+        decoded_token = await verify_id_token_cached(message["token"])
+    except (asyncio.TimeoutError, ValueError, KeyError, AttributeError):
+        return None
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        logger.warning(f"WebSocket authentication failed: {e}")
+        return None
+    return await get_current_user(decoded_token)
+
+# Streaming OCR endpoint.
+# Protocol (JSON text frames unless noted):
+#   client -> {"type": "auth", "token": "<Firebase ID token>"}            first message
+#   server -> {"type": "ready"}
+#   client -> {"type": "submit", "id": "<job id>"} then one binary frame with the image
+#   server -> {"type": "queued" | "upstream", "id"}
+#             {"type": "partial", "id", "text"}                          only with MODEL_API_STREAM_PATH
+#             {"type": "result", "id", "formula", "processing_time", "cached"}
+#             {"type": "error", "id", "status", "detail"}                   plus "retry_after" (seconds) on 429
+@router.websocket("/ws/ocr")
+async def ocr_websocket(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        user = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if user is None:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason="Invalid authentication credentials.")
+        return
+
+    connection = OcrConnection(websocket, user)
+    await connection.send("ready")
+    logger.info(f"OCR WebSocket opened for user {user.uid}")
+    try:
+        while True:
+            message = await websocket.receive_json()
+            job_id = message.get("id") if isinstance(message, dict) else None
+            if not isinstance(job_id, str) or message.get("type") != "submit":
+                await websocket.close(code=WS_CLOSE_BAD_REQUEST, reason="Expected a submit message with an id.")
+                break
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            if frame.get("bytes") is None:
+                await websocket.close(code=WS_CLOSE_BAD_REQUEST, reason="Expected the image as a binary frame.")
+                break
+            await connection.submit(job_id, frame["bytes"])
+    except (json.JSONDecodeError, KeyError):
+        await websocket.close(code=WS_CLOSE_BAD_REQUEST, reason="Expected a JSON submit message.")
+    except (WebSocketDisconnect, RuntimeError):
+        pass # Client went away
+    finally:
+        await connection.close()
+        logger.info(f"OCR WebSocket closed for user {user.uid}")
@@ -0,0 +1,180 @@
+import asyncio
+import base64
+import json
+import logging
+from typing import List, Dict, Any, Optional, Callable
+
+from google.api_core.exceptions import NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_ID = FieldPath.document_id()
+
+class ConversationNotFoundError(Exception):
+    """Raised when a conversation does not exist for the given user."""
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+def encode_cursor(sort_value: Any, document_id: str) -> str:
+    """Opaque, URL-safe page cursor: the last item's sort field value and document ID."""
+    raw = json.dumps([sort_value, document_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, document_id = json.loads(raw)
+    except Exception:
+        raise InvalidCursorError(cursor)
+    if not isinstance(document_id, str):
+        raise InvalidCursorError(cursor)
+    return sort_value, document_id
+
+class ChatRepository:
+    """
+    Non-blocking Firestore access for conversations and messages.
+    Built on Firestore's AsyncClient, so a slow round trip only suspends the
+    request waiting on it instead of stalling the whole worker.
+
+    Data layout:
+        users/{uid}/conversations/{conversation_id}
+        users/{uid}/conversations/{conversation_id}/messages/{message_id}
+    """
+
+    def __init__(self, db: firestore.AsyncClient):
+        self.db = db
+
+    async def warm_up(self):
+        """One cheap read, so the gRPC channel and access token are ready before the first request needs them."""
+        await self.db.collection('users').document('_warm_up').get()
+
+    def conversations_ref(self, uid: str):
+        return self.db.collection('users').document(uid).collection('conversations')
+
+    def messages_ref(self, uid: str, conversation_id: str):
+        return self.conversations_ref(uid).document(conversation_id).collection('messages')
+
+    async def _page(self, collection, field: str, limit: int, cursor: Optional[str]) -> tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a collection ordered by `field` descending (newest first).
+        Document ID breaks ties so items sharing a timestamp are never skipped or repeated.
+        Fetches one extra document to know whether another page exists.
+        """
+        query = (
+            collection
+            .order_by(field, direction=firestore.Query.DESCENDING)
+            .order_by(DOCUMENT_ID, direction=firestore.Query.DESCENDING)
+        )
+        if cursor:
+            sort_value, document_id = decode_cursor(cursor)
+            query = query.start_after({field: sort_value, DOCUMENT_ID: document_id})
+        docs = [doc async for doc in query.limit(limit + 1).stream()]
+
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_cursor(docs[-1].get(field), docs[-1].id)
+        return [doc.to_dict() for doc in docs], next_cursor
+
+    # --- Conversations ---
+    async def list_conversations(self, uid: str, limit: int, cursor: Optional[str] = None) -> tuple[List[Dict[str, Any]], Optional[str]]:
+        """Conversations by most recent activity, newest first."""
+        return await self._page(self.conversations_ref(uid), 'lastMessageAt', limit, cursor)
+
+    async def create_conversation(self, uid: str, conversation: Dict[str, Any]):
+        await self.conversations_ref(uid).document(conversation['id']).set(conversation)
+
+    async def update_conversation_title(self, uid: str, conversation_id: str, title: str) -> Dict[str, Any]:
+        # update() only succeeds on an existing document, so it doubles as the existence check;
+        # the read runs alongside it instead of before it
+        conv_ref = self.conversations_ref(uid).document(conversation_id)
+        try:
+            _, conv_doc = await asyncio.gather(conv_ref.update({"title": title}), conv_ref.get())
+        except NotFound:
+            raise ConversationNotFoundError(conversation_id)
+        if not conv_doc.exists: # Deleted between the two calls
+            raise ConversationNotFoundError(conversation_id)
+        conversation = conv_doc.to_dict()
+        conversation["title"] = title
+        return conversation
+
+    async def get_conversation(self, uid: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        conv_doc = await self.conversations_ref(uid).document(conversation_id).get()
+        return conv_doc.to_dict() if conv_doc.exists else None
+
+    async def mark_conversation_deleting(self, uid: str, conversation_id: str):
+        conv_ref = self.conversations_ref(uid).document(conversation_id)
+        conv_doc = await conv_ref.get()
+        if not conv_doc.exists:
+            raise ConversationNotFoundError(conversation_id)
+        await conv_ref.update({"deleting": True})
+
+    async def delete_conversation(
+        self,
+        uid: str,
+        conversation_id: str,
+        batch_size: int = 500,
+        concurrency: int = 4,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        """
+        Deletes all messages of a conversation, then the conversation itself.
+        Message references are read a page at a time (IDs only), deleted with batched
+        writes of up to `batch_size` documents, and up to `concurrency` batches are
+        committed at once. Returns the number of messages deleted.
+        """
+        batch_size = max(1, min(batch_size, 500))
+        messages_query = self.messages_ref(uid, conversation_id).select([])
+        deleted = 0
+        while True:
+            docs = await messages_query.limit(batch_size * concurrency).get()
+            if not docs:
+                break
+            batches = []
+            for start in range(0, len(docs), batch_size):
+                batch = self.db.batch()
+                for doc in docs[start:start + batch_size]:
+                    batch.delete(doc.reference)
+                batches.append(batch)
+            await asyncio.gather(*(batch.commit() for batch in batches))
+            deleted += len(docs)
+            if progress is not None:
+                progress(deleted)
+        await self.conversations_ref(uid).document(conversation_id).delete()
+        return deleted
+
+    # --- Messages ---
+    async def list_messages(self, uid: str, conversation_id: str, limit: int, cursor: Optional[str] = None) -> tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        The most recent `limit` messages in chronological order. The cursor walks
+        backwards in time, so each following page holds older messages.
+        """
+        messages, next_cursor = await self._page(self.messages_ref(uid, conversation_id), 'timestamp', limit, cursor)
+        messages.reverse()
+        return messages, next_cursor
+
+    async def add_message(self, uid: str, conversation_id: str, message: Dict[str, Any]):
+        """
+        Writes the message and bumps the conversation's lastMessageAt/messageCount in one
+        atomic batch. The update fails the whole commit if the conversation does not exist,
+        so no separate existence check is needed and the counter cannot drift.
+        """
+        conv_ref = self.conversations_ref(uid).document(conversation_id)
+        batch = self.db.batch()
+        batch.set(self.messages_ref(uid, conversation_id).document(message['id']), message)
+        batch.update(conv_ref, {
+            "lastMessageAt": message['timestamp'],
+            "messageCount": firestore.Increment(1)
+        })
+        try:
+            await batch.commit()
+        except NotFound:
+            raise ConversationNotFoundError(conversation_id)
+
+def create_chat_repository() -> ChatRepository:
+    """A repository on the default Firebase app's Firestore; initialize_firebase() must have run."""
+    from firebase_admin import firestore_async
+    return ChatRepository(firestore_async.client())
@@ -0,0 +1,354 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upstream answers worth trying again: the request never reached a healthy model server
+RETRYABLE_STATUS_CODES = {status.HTTP_502_BAD_GATEWAY, status.HTTP_503_SERVICE_UNAVAILABLE, status.HTTP_504_GATEWAY_TIMEOUT}
+
+class UpstreamUnavailableError(HTTPException):
+    """
+    Raised without calling the upstream: the circuit is open, no endpoint is
+    available, the concurrency limit is reached or the batch queue is full.
+    """
+
+class UpstreamTimeoutError(HTTPException):
+    """The upstream took the request but did not answer in time. Not retried: another attempt would likely hang just as long."""
+
+def is_retryable(error: Exception) -> bool:
+    return (
+        isinstance(error, HTTPException)
+        and not isinstance(error, (UpstreamUnavailableError, UpstreamTimeoutError))
+        and error.status_code in RETRYABLE_STATUS_CODES
+    )
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Errors that say something about upstream health; 4xx answers (e.g. a bad image) do not."""
+    return not isinstance(error, HTTPException) or error.status_code >= 500
+
+def is_congestion(error: Exception) -> bool:
+    """
+    Upstream failures that mean it is overloaded: its 5xx answers, timeouts and
+    connection errors. Calls turned away before reaching it do not count, or a
+    shed or circuit-broken call would shrink the concurrency limit further.
+    """
+    return is_upstream_failure(error) and not isinstance(error, UpstreamUnavailableError)
+
+def _unavailable(detail: str, retry_after: float) -> UpstreamUnavailableError:
+    return UpstreamUnavailableError(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(max(1, round(retry_after)))}
+    )
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and rejects calls
+    immediately for `recovery_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float, name: str = "model_api"):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def would_allow(self) -> bool:
+        """Whether allow() would let a call through, without taking the half-open trial."""
+        if self.state == self.OPEN:
+            return self.retry_after() == 0
+        if self.state == self.HALF_OPEN:
+            return not self._trial_in_flight
+        return True
+
+    def check(self):
+        """Raise 503 instead of calling an upstream that is known to be failing."""
+        if not self.allow():
+            self.rejected += 1
+            raise _unavailable("Model API is temporarily unavailable. Please try again shortly.", self.retry_after() or 1)
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit '{self.name}' closed.")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_cancelled(self):
+        """A call that was abandoned (e.g. the losing side of a hedge) says nothing about health."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit '{self.name}' opened after {self.consecutive_failures} consecutive failures.")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    async def call(self, call: Callable[[], Awaitable[T]]) -> T:
+        """One call gated by and reported to the breaker."""
+        self.check()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self.record_cancelled()
+            raise
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.record_failure()
+            else:
+                self.record_success() # The upstream answered; the request was the problem
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+class RetryBudget:
+    """
+    Caps retries (and hedged requests) at `ratio` per original request plus a
+    floor of `min_per_second`, so an upstream outage cannot be amplified into a
+    retry storm. Unspent budget accumulates up to `max_balance`.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_balance: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self._updated = time.monotonic()
+        self.withdrawn = 0
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.balance = min(self.max_balance, self.balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        """Called once per original request."""
+        self._refill()
+        self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self.balance >= 1:
+            self.balance -= 1
+            self.withdrawn += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> Dict:
+        self._refill()
+        return {"balance": round(self.balance, 2), "withdrawn": self.withdrawn, "exhausted": self.exhausted}
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, for percentile-based hedge delays."""
+
+    def __init__(self, window: int = 500):
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if len(self.samples) < 20: # Too few samples to say what slow means
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on concurrent upstream calls. Every call that completes within
+    `latency_target` grows the limit by about one per window of calls (additive
+    increase); a failure or a slow call shrinks it by `backoff` (multiplicative
+    decrease), at most once per round trip: calls that started before the last
+    decrease do not shrink it again. Calls beyond the limit are shed with 503
+    right away instead of queueing behind a saturated upstream.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, latency_target: float, backoff: float):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.shed = 0
+        self._last_decrease = 0.0
+
+    def acquire(self) -> float:
+        """Take a slot; returns the call's start time, to be passed to release()."""
+        if self.in_flight >= int(self.limit):
+            self.shed += 1
+            raise _unavailable("Server is busy. Please try again shortly.", 1)
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, congested: bool):
+        """`congested` is set when the call failed because the upstream is overloaded (see is_congestion)."""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if congested or now - started > self.latency_target:
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self) -> Dict:
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "shed": self.shed}
+
+class ResilientCaller:
+    """
+    Runs upstream calls through a concurrency limiter, a circuit breaker,
+    budgeted retries with full-jitter exponential backoff and, optionally, a
+    hedged second attempt once the first has taken longer than the recent p95.
+    Any of the components can be left out (None).
+    """
+
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker],
+        limiter: Optional[AdaptiveConcurrencyLimiter],
+        retry_budget: Optional[RetryBudget],
+        max_retries: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        hedge_percentile: Optional[float],
+        hedge_min_delay: float,
+    ):
+        self.breaker = breaker
+        self.limiter = limiter
+        self.retry_budget = retry_budget
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _can_spend_extra_attempt(self) -> bool:
+        return self.retry_budget is None or self.retry_budget.try_withdraw()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        result = await (self.breaker.call(call) if self.breaker is not None else call())
+        self.latencies.record(time.perf_counter() - started)
+        return result
+
+    async def _hedged_attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        delay = self.latencies.percentile(self.hedge_percentile)
+        if delay is None:
+            return await self._attempt(call)
+        primary = asyncio.create_task(self._attempt(call))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=max(delay, self.hedge_min_delay))
+            if done or not self._can_spend_extra_attempt():
+                pending = set()
+                return await primary
+
+            self.hedges += 1
+            hedge = asyncio.create_task(self._attempt(call))
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending: # The slower attempt, or both when the caller went away
+                task.cancel()
+
+    async def call(self, call: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        `call` must be safe to invoke more than once, including concurrently when
+        hedging; pass hedge=False when it is not.
+        """
+        if self.retry_budget is not None:
+            self.retry_budget.deposit()
+        started = self.limiter.acquire() if self.limiter is not None else None
+        congested = False
+        try:
+            attempt = 0
+            while True:
+                try:
+                    if hedge and self.hedge_percentile is not None:
+                        return await self._hedged_attempt(call)
+                    return await self._attempt(call)
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= self.max_retries or not self._can_spend_extra_attempt():
+                        congested = is_congestion(e)
+                        raise
+                    self.retries += 1
+                    delay = self._backoff(attempt)
+                    attempt += 1
+                    logger.warning(f"Model API call failed with {e.status_code}; retry {attempt} in {delay * 1000:.0f} ms")
+                    await asyncio.sleep(delay)
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(started, congested)
+
+    def stats(self) -> Dict:
+        return {
+            "circuit_breaker": self.breaker.stats() if self.breaker is not None else None,
+            "limiter": self.limiter.stats() if self.limiter is not None else None,
+            "retry_budget": self.retry_budget.stats() if self.retry_budget is not None else None,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p95_latency": self.latencies.percentile(95),
+        }
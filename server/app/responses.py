@@ -0,0 +1,37 @@
+import json
+from typing import Any, Dict, Optional, Type
+
+from fastapi import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError: # orjson is optional; the standard library encoder gives the same output, slower
+    orjson = None
+
+_field_defaults: Dict[Type[BaseModel], Dict[str, Any]] = {}
+
+def project(model: Type[BaseModel], doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The model's fields from a stored document, without validating them again:
+    documents are written from validated models, so only fields missing from
+    older documents need filling in with their defaults.
+    """
+    defaults = _field_defaults.get(model)
+    if defaults is None:
+        defaults = _field_defaults[model] = {
+            name: None if field.is_required() else field.default for name, field in model.model_fields.items()
+        }
+    return {name: doc.get(name, default) for name, default in defaults.items()}
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def json_response(content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    A JSON response that bypasses response_model validation and serialization.
+    The route's response_model still documents the shape in the OpenAPI schema.
+    """
+    return Response(content=content if isinstance(content, bytes) else dumps(content), media_type="application/json", headers=headers)
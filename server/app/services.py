@@ -1,61 +1,641 @@
+import asyncio
 import httpx
+import json
 import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Awaitable, Callable, Any, Union, List
 
 from fastapi import HTTPException, status
-from config import settings 
+from config import settings
+from cache import get_latex_cache, image_digest
+from batching import BatchDispatcher, BatchUnsupportedError
+from resilience import ResilientCaller, CircuitBreaker, AdaptiveConcurrencyLimiter, RetryBudget, UpstreamTimeoutError
+from upstreams import Endpoint, UpstreamBalancer
+from fairqueue import FairQueue, QueueFullError
+from metrics import timed_stage
+from models import UserProfile
+from uploads import SpooledImage
+from imaging import preprocessing_enabled, normalize_image_async, sniff_content_type, filename_for
 
 logger = logging.getLogger(__name__)
 
-async def process_image_with_model(image_data: bytes) -> tuple[str, float]:
-    """
-    Sends image data to the Model API Backend for LaTeX formula prediction.
-    """
-    model_api_url = settings.MODEL_API_BASE_URL
-    model_api_key = settings.MODEL_API_KEY
+# --- Model API endpoints ---
+# Each Model API endpoint gets a long-lived client that keeps connections alive
+# between requests instead of paying a TCP (and TLS) handshake on every OCR call.
+_balancer: Optional[UpstreamBalancer] = None
+
+def _phase_timeout(value: Optional[float]) -> float:
+    return value if value is not None else settings.MODEL_API_TIMEOUT
+
+def create_model_client() -> httpx.AsyncClient:
+    """Build the pooled HTTP client used for the calls to one Model API endpoint."""
+    limits = httpx.Limits(
+        max_connections=settings.MODEL_API_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.MODEL_API_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.MODEL_API_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=_phase_timeout(settings.MODEL_API_CONNECT_TIMEOUT),
+        read=_phase_timeout(settings.MODEL_API_READ_TIMEOUT),
+        write=_phase_timeout(settings.MODEL_API_WRITE_TIMEOUT),
+        pool=_phase_timeout(settings.MODEL_API_POOL_TIMEOUT),
+    )
+    http2 = settings.MODEL_API_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("MODEL_API_HTTP2 is enabled but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+            http2 = False
+    logger.info(
+        f"Creating Model API client (max_connections={settings.MODEL_API_MAX_CONNECTIONS}, "
+        f"max_keepalive={settings.MODEL_API_MAX_KEEPALIVE_CONNECTIONS}, http2={http2})"
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
 
-    if not model_api_url:
+def _model_api_base_urls() -> List[str]:
+    """MODEL_API_BASE_URLS (comma-separated) when set, otherwise the single MODEL_API_BASE_URL."""
+    if settings.MODEL_API_BASE_URLS:
+        return [url.strip() for url in settings.MODEL_API_BASE_URLS.split(",") if url.strip()]
+    return [settings.MODEL_API_BASE_URL] if settings.MODEL_API_BASE_URL else []
+
+def create_balancer(client_factory: Callable[[], httpx.AsyncClient] = create_model_client) -> UpstreamBalancer:
+    urls = _model_api_base_urls()
+    if not urls:
         logger.error("MODEL_API_BASE_URL is not configured in settings.")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Model API URL is not configured.")
+    endpoints = []
+    for url in urls:
+        breaker = CircuitBreaker(
+            settings.MODEL_API_BREAKER_FAILURE_THRESHOLD,
+            settings.MODEL_API_BREAKER_RECOVERY_TIMEOUT,
+            name=url,
+        ) if settings.MODEL_API_BREAKER_ENABLED else None
+        endpoints.append(Endpoint(url, client_factory(), breaker))
+    return UpstreamBalancer(
+        endpoints,
+        strategy=settings.MODEL_API_LB_STRATEGY,
+        ewma_alpha=settings.MODEL_API_LB_EWMA_ALPHA,
+        health_path=settings.MODEL_API_HEALTH_PATH,
+        health_interval=settings.MODEL_API_HEALTH_INTERVAL,
+        health_timeout=settings.MODEL_API_HEALTH_TIMEOUT,
+        eject_after=settings.MODEL_API_HEALTH_EJECT_AFTER,
+        readmit_after=settings.MODEL_API_HEALTH_READMIT_AFTER,
+        health_headers=_model_api_headers(),
+    )
+
+async def init_model_client() -> Optional[UpstreamBalancer]:
+    """Create the Model API endpoint clients and start health checks. Called from the application lifespan."""
+    global _balancer
+    if _balancer is None:
+        if not _model_api_base_urls():
+            logger.error("MODEL_API_BASE_URL is not configured in settings.")
+            return None
+        balancer = await asyncio.to_thread(create_balancer) # The first client pulls in the HTTP transport; keep the loop free
+        if _balancer is None: # A request may have created one lazily meanwhile
+            _balancer = balancer
+        else:
+            await balancer.close()
+    _balancer.start()
+    return _balancer
+
+async def warm_up_model_api():
+    """Create the endpoint clients and probe every endpoint once, opening a pooled connection to each before the first OCR request."""
+    balancer = await init_model_client()
+    if balancer is not None:
+        await balancer.check_health()
+
+def model_api_reachable() -> bool:
+    """Whether a Model API endpoint is known to be up; False before the clients exist."""
+    return _balancer is not None and _balancer.reachable()
+
+async def close_model_client():
+    """Stop health checks and close every endpoint client, releasing pooled connections."""
+    global _balancer
+    if _balancer is not None:
+        await _balancer.close()
+        _balancer = None
+        logger.info("Model API clients closed.")
+
+def get_balancer() -> UpstreamBalancer:
+    """
+    Returns the Model API endpoint balancer, creating it lazily (without health
+    checks) if the lifespan has not run, e.g. when the service is used outside
+    the FastAPI app.
+    """
+    global _balancer
+    if _balancer is None:
+        _balancer = create_balancer()
+    return _balancer
+
+def _pool_stats(client: httpx.AsyncClient) -> Dict:
+    pool = getattr(client._transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    return {
+        "http2": bool(getattr(pool, "_http2", False)),
+        "connections": len(connections),
+        "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+        "active_connections": sum(1 for conn in connections if not conn.is_idle() and not conn.is_closed()),
+        "queued_requests": len(getattr(pool, "_requests", [])),
+    }
+
+def get_model_pool_stats() -> Dict:
+    """Snapshot of each Model API endpoint: health, load and its connection pool."""
+    if _balancer is None:
+        return {"initialized": False}
+    stats = _balancer.stats()
+    for endpoint, endpoint_stats in zip(_balancer.endpoints, stats["endpoints"]):
+        endpoint_stats["pool"] = _pool_stats(endpoint.client)
+    return {
+        "initialized": True,
+        "max_connections": settings.MODEL_API_MAX_CONNECTIONS,
+        "max_keepalive_connections": settings.MODEL_API_MAX_KEEPALIVE_CONNECTIONS,
+        **stats,
+    }
+
+# Called with an event name ("upstream" or "partial") and its payload while an image is processed
+ProgressCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+async def _notify(progress: Optional[ProgressCallback], event: str, **payload):
+    """
+    Deliver a progress event. Delivery failures (typically a client that went
+    away) are logged and swallowed: they must not fail the prediction, nor be
+    counted against the Model API endpoint by its circuit breaker.
+    """
+    if progress is None:
+        return
+    try:
+        await progress(event, payload)
+    except Exception as e:
+        logger.warning(f"Failed to deliver '{event}' progress event: {e}")
+
+# --- Request coalescing ---
+class _Call:
+    """One in-flight execution of a SingleFlight key and the callers waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.listeners: List[ProgressCallback] = []
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution.
+    The first caller starts the call; callers arriving while it is in flight
+    wait on the same task and receive its result or exception. A caller that
+    goes away leaves the call running for the others; it is cancelled only
+    when nobody is left waiting for it.
+
+    The call runs in its own task and outlives the caller that started it, so
+    `fn` must own its inputs. Its only link back to the callers is the progress
+    callback it is given (None if the first caller passed none), which forwards
+    each event to every caller still waiting; one caller's failing callback
+    affects no one else.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def _running(self, key: str) -> Optional[_Call]:
+        call = self._calls.get(key)
+        # A finished call stays registered until its done callback runs; it is not joinable
+        return call if call is not None and not call.task.done() else None
+
+    def in_flight(self, key: str) -> bool:
+        return self._running(key) is not None
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[Optional[ProgressCallback]], Awaitable[Any]],
+        progress: Optional[ProgressCallback] = None
+    ) -> Any:
+        call = self._running(key)
+        if call is not None:
+            self.coalesced += 1
+            logger.info(f"Coalesced request for image {key[:12]} onto in-flight Model API call")
+        else:
+            listeners: List[ProgressCallback] = []
+
+            async def broadcast(event: str, payload: Dict[str, Any]):
+                for listener in list(listeners):
+                    await _notify(listener, event, **payload)
+
+            # Run in its own task so a disconnecting first caller does not cancel the call for everyone
+            call = _Call(asyncio.ensure_future(fn(broadcast if progress is not None else None)))
+            call.listeners = listeners
+            self._calls[key] = call
+            self.executions += 1
+            call.task.add_done_callback(lambda t: self._finish(key, t))
+        call.waiters += 1
+        if progress is not None:
+            call.listeners.append(progress)
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel() # The last caller went away; nobody needs the result
+                self.abandoned += 1
+            raise
+        finally:
+            call.waiters -= 1
+            if progress is not None:
+                call.listeners.remove(progress)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call is not None and call.task is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception() # Mark as retrieved when every waiter has gone away
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+_single_flight = SingleFlight()
+
+def get_single_flight_stats() -> Dict[str, int]:
+    return _single_flight.stats()
+
+async def process_image_with_model(
+    image_data: Union[bytes, SpooledImage],
+    progress: Optional[ProgressCallback] = None,
+    user: Optional[UserProfile] = None
+) -> tuple[str, float, bool]:
+    """
+    Returns the LaTeX formula for an image, its processing time and whether it
+    was served from the result cache. Identical images are only sent to the
+    Model API once per cache TTL, and concurrent uploads of the same image
+    share a single upstream call; for cache hits the processing time is the
+    lookup time.
+
+    Streamed uploads (SpooledImage) that rolled over to disk are forwarded to
+    the Model API from their spooled file without being read into memory;
+    smaller ones are already in memory and are sent (and batched) as bytes. When image
+    preprocessing is enabled the image is normalized first, and the result is
+    cached under both the uploaded and the normalized image's digest.
+
+    `progress`, if given, is awaited with "upstream" when the image is sent to
+    the Model API and with "partial" for each token when the Model API streams
+    its output (MODEL_API_STREAM_PATH). Requests coalesced onto another
+    caller's upstream call see the events sent after they joined it, if that
+    caller asked for progress.
+
+    `user`, if given, is the requester's place in the fair queue in front of
+    the Model API; calls without one are not queued.
+    """
+    started = time.perf_counter()
+    key = image_data.digest if isinstance(image_data, SpooledImage) else image_digest(image_data)
+    cache = get_latex_cache()
+    if cache is not None:
+        cached_result = await cache.get(key)
+        if cached_result is not None:
+            lookup_time = time.perf_counter() - started
+            logger.info(f"LaTeX cache hit for image {key[:12]} ({lookup_time * 1000:.2f} ms)")
+            return cached_result["formula"], lookup_time, True
+
+    while True:
+        try:
+            return await _predict_coalesced(key, image_data, progress, user, started)
+        except QueueFullError as e:
+            if user is not None and e.key == user.uid:
+                raise
+            # Coalesced onto a call whose user had too many images waiting; this caller's own queue may not be full
+            logger.info(f"Shared call for image {key[:12]} was turned away by the fair queue; retrying as this request's own call")
+
+async def _predict_coalesced(
+    key: str,
+    image_data: Union[bytes, SpooledImage],
+    progress: Optional[ProgressCallback],
+    user: Optional[UserProfile],
+    started: float
+) -> tuple[str, float, bool]:
+    cache = get_latex_cache()
+    # The shared call outlives this request, whose upload is closed when it ends,
+    # so a caller that may start the call hands it a copy of the image to own
+    image = None
+    if not _single_flight.in_flight(key):
+        image = await _own_image(image_data)
+    launched = False
+
+    async def predict_and_store(progress: Optional[ProgressCallback]) -> tuple[str, float, bool]:
+        try:
+            payload = image
+            keys = [key]
+            if preprocessing_enabled():
+                payload = await _normalize(image)
+                normalized_key = image_digest(payload)
+                if cache is not None and normalized_key != key:
+                    cached_result = await cache.get(normalized_key)
+                    if cached_result is not None:
+                        await cache.set(key, cached_result)
+                        return cached_result["formula"], time.perf_counter() - started, True
+                keys.append(normalized_key)
+
+            async with _fair_share(user):
+                await _notify(progress, "upstream")
+                formula, processing_time = await _predict(payload, progress)
+            if cache is not None:
+                for cache_key in keys:
+                    await cache.set(cache_key, {"formula": formula, "processing_time": processing_time})
+            return formula, processing_time, False
+        finally:
+            if isinstance(image, SpooledImage):
+                image.close()
 
+    def launch(progress: Optional[ProgressCallback]) -> Awaitable[tuple[str, float, bool]]:
+        nonlocal launched
+        launched = True
+        return predict_and_store(progress)
+
+    try:
+        return await _single_flight.do(key, launch, progress)
+    finally:
+        if not launched and isinstance(image, SpooledImage):
+            image.close() # Another request started the call while the copy was being made
+
+async def _own_image(image_data: Union[bytes, SpooledImage]) -> Union[bytes, SpooledImage]:
+    if not isinstance(image_data, SpooledImage):
+        return image_data
+    if image_data.size <= settings.UPLOAD_SPOOL_MAX_MEMORY:
+        read = image_data.read # Already in memory, as bytes it can be batched and hedged
+    else:
+        read = image_data.copy
+    # In a thread either way: the blob store may be reading the same upload
+    return await asyncio.to_thread(read)
+
+async def _normalize(image_data: Union[bytes, SpooledImage]) -> bytes:
+    raw = image_data.read() if isinstance(image_data, SpooledImage) else image_data
+    try:
+        normalized = await normalize_image_async(raw)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Uploaded file is not a valid image.")
+    logger.info(f"Normalized image from {len(raw)} to {len(normalized)} bytes")
+    return normalized
+
+# --- Fair sharing between users ---
+_fair_queue: Optional[FairQueue] = None
+
+def get_fair_queue() -> Optional[FairQueue]:
+    """Returns the process-wide fair queue, or None when fair queueing is disabled."""
+    global _fair_queue
+    if not settings.FAIR_QUEUE_ENABLED:
+        return None
+    if _fair_queue is None:
+        _fair_queue = FairQueue(settings.FAIR_QUEUE_CONCURRENCY, settings.FAIR_QUEUE_MAX_WAITING_PER_USER)
+    return _fair_queue
+
+def get_fair_queue_stats() -> Dict:
+    return _fair_queue.stats() if _fair_queue is not None else {"enabled": settings.FAIR_QUEUE_ENABLED}
+
+@asynccontextmanager
+async def _fair_share(user: Optional[UserProfile]):
+    """Wait for the user's turn at the Model API; anonymous users get a smaller share."""
+    queue = get_fair_queue()
+    if queue is None or user is None:
+        yield
+        return
+    weight = settings.FAIR_QUEUE_WEIGHT_ANONYMOUS if user.isAnonymous else settings.FAIR_QUEUE_WEIGHT_AUTHENTICATED
+    with timed_stage("ocr_queue"):
+        await queue.acquire(user.uid, weight)
+    try:
+        yield
+    finally:
+        queue.release()
+
+# --- Micro-batching ---
+_batch_dispatcher: Optional[BatchDispatcher] = None
+
+async def start_batch_dispatcher():
+    """Start the micro-batching dispatcher when batching is enabled. Called from the application lifespan."""
+    global _batch_dispatcher
+    if settings.MODEL_API_BATCHING_ENABLED and _batch_dispatcher is None:
+        _batch_dispatcher = BatchDispatcher(
+            send_batch=_call_model_api_batch,
+            send_single=_call_model_api,
+            max_batch_size=settings.MODEL_API_BATCH_MAX_SIZE,
+            window_seconds=settings.MODEL_API_BATCH_WINDOW_MS / 1000,
+            queue_size=settings.MODEL_API_BATCH_QUEUE_SIZE,
+            request_timeout=settings.MODEL_API_BATCH_REQUEST_TIMEOUT,
+        )
+        _batch_dispatcher.start()
+
+async def stop_batch_dispatcher():
+    global _batch_dispatcher
+    if _batch_dispatcher is not None:
+        await _batch_dispatcher.stop()
+        _batch_dispatcher = None
+
+def get_batching_stats() -> Dict:
+    return _batch_dispatcher.stats() if _batch_dispatcher is not None else {"enabled": False}
+
+# --- Resilience ---
+_upstream_guard: Optional[ResilientCaller] = None
+
+def get_upstream_guard() -> ResilientCaller:
+    """Retries, hedging and concurrency limiting for Model API calls, configured from settings."""
+    global _upstream_guard
+    if _upstream_guard is None:
+        _upstream_guard = ResilientCaller(
+            breaker=None, # Circuit breakers are per endpoint, in the balancer
+            limiter=AdaptiveConcurrencyLimiter(
+                initial=settings.MODEL_API_LIMITER_INITIAL,
+                min_limit=settings.MODEL_API_LIMITER_MIN,
+                max_limit=settings.MODEL_API_LIMITER_MAX,
+                latency_target=settings.MODEL_API_LIMITER_LATENCY_TARGET,
+                backoff=settings.MODEL_API_LIMITER_BACKOFF,
+            ) if settings.MODEL_API_LIMITER_ENABLED else None,
+            retry_budget=RetryBudget(
+                settings.MODEL_API_RETRY_BUDGET_RATIO,
+                settings.MODEL_API_RETRY_BUDGET_MIN_PER_SECOND,
+            ),
+            max_retries=settings.MODEL_API_MAX_RETRIES,
+            retry_base_delay=settings.MODEL_API_RETRY_BASE_DELAY,
+            retry_max_delay=settings.MODEL_API_RETRY_MAX_DELAY,
+            hedge_percentile=settings.MODEL_API_HEDGE_PERCENTILE if settings.MODEL_API_HEDGING_ENABLED else None,
+            hedge_min_delay=settings.MODEL_API_HEDGE_MIN_DELAY,
+        )
+    return _upstream_guard
+
+def get_resilience_stats() -> Dict:
+    return get_upstream_guard().stats()
+
+async def _predict(image_data: Union[bytes, SpooledImage], progress: Optional[ProgressCallback] = None) -> tuple[str, float]:
+    """
+    Route a prediction through the streaming endpoint when the caller wants partial
+    output and one is configured, else through the batch dispatcher when it is running.
+    Every route goes through the upstream guard.
+    """
+    if isinstance(image_data, SpooledImage) and image_data.size <= settings.UPLOAD_SPOOL_MAX_MEMORY:
+        image_data = image_data.read() # Already in memory; as bytes it can be batched and hedged
+    streaming = progress is not None and bool(settings.MODEL_API_STREAM_PATH)
+    hedge = settings.MODEL_API_HEDGING_ENABLED and not streaming # Hedged partial tokens would interleave
+    if hedge and isinstance(image_data, SpooledImage):
+        hedge = False # Concurrent attempts cannot share one file position
+
+    if streaming:
+        attempt = lambda: _call_model_api_stream(image_data, progress)
+    elif _batch_dispatcher is not None and isinstance(image_data, bytes):
+        attempt = lambda: _batch_dispatcher.submit(image_data)
+    else:
+        attempt = lambda: _call_model_api(image_data)
+    return await get_upstream_guard().call(attempt, hedge=hedge)
+
+# --- Model API calls ---
+def _model_api_headers() -> Dict[str, str]:
+    """Returns the Model API request headers."""
+    model_api_key = settings.MODEL_API_KEY
     if not model_api_key:
         logger.warning("MODEL_API_KEY is not configured. Calling Model API without authentication.")
 
     headers = {}
     if model_api_key:
         headers["X-API-Key"] = model_api_key
+    return headers
 
-    files = {'file': ('image.png', image_data, 'image/png')} # Assuming the image is in PNG format
+async def _call_model_api_batch(images: list[bytes]) -> list:
+    """
+    Sends several images to the Model API batch endpoint in one multipart request.
+    The endpoint receives repeated 'files' parts and must answer with
+    {"results": [{"formula": ..., "processing_time": ...} | {"error": ...}, ...]} in upload order.
+    """
+    headers = _model_api_headers()
+    files = []
+    for image_data in images:
+        content_type = sniff_content_type(image_data)
+        files.append(('files', (filename_for(content_type), image_data, content_type)))
 
-    async with httpx.AsyncClient() as client:
+    async def send(endpoint: Endpoint) -> Optional[httpx.Response]:
         try:
-            response = await client.post(f"{model_api_url}/predict", files=files, headers=headers, timeout=settings.MODEL_API_TIMEOUT)
+            response = await endpoint.client.post(f"{endpoint.url}{settings.MODEL_API_BATCH_PATH}", files=files, headers=headers)
+            if response.status_code in (status.HTTP_404_NOT_FOUND, status.HTTP_405_METHOD_NOT_ALLOWED, status.HTTP_501_NOT_IMPLEMENTED):
+                return None # Not a failure of the endpoint, so not reported to its circuit breaker
+            response.raise_for_status()
+            return response
+        except Exception as e:
+            raise _model_api_error(e) # Classified like single calls, so the upstream guard can decide on retries
+
+    response = await get_balancer().call(send)
+    if response is None:
+        raise BatchUnsupportedError(f"No batch endpoint at {settings.MODEL_API_BATCH_PATH}")
+
+    results = []
+    for item in response.json().get("results", []):
+        if item.get("formula"):
+            results.append((item["formula"], item.get("processing_time")))
+        else:
+            results.append(HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Model API error: {item.get('error', 'no formula returned')}"
+            ))
+    logger.info(f"Model API batch prediction of {len(images)} images successful.")
+    return results
+
+def _prediction_files(image_data: Union[bytes, SpooledImage]) -> Dict[str, tuple]:
+    if isinstance(image_data, SpooledImage):
+        # httpx streams file objects in chunks instead of copying them into the request body
+        content_type = sniff_content_type(image_data.head, default=image_data.content_type)
+        return {'file': (image_data.filename, image_data.rewind(), content_type)}
+    content_type = sniff_content_type(image_data)
+    return {'file': (filename_for(content_type), image_data, content_type)}
+
+def _model_api_error(e: Exception) -> HTTPException:
+    """Translate a failed Model API call into the HTTPException returned to the client."""
+    if isinstance(e, httpx.TimeoutException) and not isinstance(e, httpx.ConnectTimeout):
+        logger.error(f"Model API timed out: {e!r}")
+        return UpstreamTimeoutError(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Model API did not respond in time: {e.request.url}"
+        )
+    if isinstance(e, httpx.RequestError):
+        logger.error(f"Network error calling Model API: {e}", exc_info=True)
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Cannot connect to Model API: {e.request.url}"
+        )
+    if isinstance(e, httpx.HTTPStatusError):
+        logger.error(f"Model API returned HTTP error {e.response.status_code}: {e.response.text}", exc_info=True)
+        return HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Model API error: {e.response.text}"
+        )
+    logger.error(f"Unexpected error when calling Model API: {e}", exc_info=True)
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error communicating with Model API: {e}"
+    )
+
+async def _call_model_api(image_data: Union[bytes, SpooledImage]) -> tuple[str, float]:
+    """
+    Sends image data to the Model API Backend for LaTeX formula prediction.
+    """
+    headers = _model_api_headers()
+
+    async def send(endpoint: Endpoint) -> tuple[str, float]:
+        try:
+            response = await endpoint.client.post(f"{endpoint.url}/predict", files=_prediction_files(image_data), headers=headers)
             response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-            
+
             result = response.json()
             formula = result.get("formula")
             processing_time = result.get("processing_time")
 
             if not formula:
                 raise ValueError("Model API did not return a formula.")
-            
+
             logger.info(f"Model API prediction successful. Formula: {formula[:50]}..., Time: {processing_time:.2f}s")
             return formula, processing_time
 
-        except httpx.RequestError as e:
-            logger.error(f"Network error calling Model API: {e}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"Cannot connect to Model API: {e.request.url}"
-            )
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Model API returned HTTP error {e.response.status_code}: {e.response.text}", exc_info=True)
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=f"Model API error: {e.response.text}"
-            )
         except Exception as e:
-            logger.error(f"Unexpected error when calling Model API: {e}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error communicating with Model API: {e}"
-            )
\ No newline at end of file
+            raise _model_api_error(e)
+
+    return await get_balancer().call(send)
+
+async def _call_model_api_stream(image_data: Union[bytes, SpooledImage], progress: ProgressCallback) -> tuple[str, float]:
+    """
+    Sends image data to the Model API streaming endpoint, which answers with
+    newline-delimited JSON: {"token": ...} lines while decoding, then a final
+    {"formula": ..., "processing_time": ...} line.
+    """
+    headers = _model_api_headers()
+
+    async def send(endpoint: Endpoint) -> tuple[str, float]:
+        formula, processing_time = None, None
+        try:
+            async with endpoint.client.stream(
+                "POST", f"{endpoint.url}{settings.MODEL_API_STREAM_PATH}", files=_prediction_files(image_data), headers=headers
+            ) as response:
+                if response.is_error:
+                    await response.aread() # Make the body available to the error message
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if "token" in event:
+                        await _notify(progress, "partial", text=event["token"])
+                    elif "error" in event:
+                        raise ValueError(f"Model API stream error: {event['error']}")
+                    elif "formula" in event:
+                        formula, processing_time = event["formula"], event.get("processing_time")
+
+            if not formula:
+                raise ValueError("Model API did not return a formula.")
+
+            logger.info(f"Model API streamed prediction successful. Formula: {formula[:50]}..., Time: {processing_time:.2f}s")
+            return formula, processing_time
+
+        except Exception as e:
+            raise _model_api_error(e)
+
+    return await get_balancer().call(send)
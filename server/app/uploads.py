@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import shutil
+import threading
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Optional, List
+
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError: # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from config import settings
+from metrics import observe_upload_size
+
+logger = logging.getLogger(__name__)
+
+# Room for multipart boundaries, part headers and small form fields on top of the image itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Leading bytes kept aside while spooling: enough to recognise every supported image format
+HEAD_BYTES = 16
+
+class SpooledImage:
+    """
+    An uploaded image held in a spooled temporary file: small images stay in memory,
+    larger ones roll over to disk. The SHA-256 digest, size and leading bytes are
+    captured while the upload streams in, so the bytes never have to be held in
+    memory at once.
+
+    The OCR call and the blob store can read the same upload from worker threads;
+    whole-file reads share the file position, so they take turns.
+    """
+
+    def __init__(self, filename: Optional[str], content_type: Optional[str]):
+        self.filename = filename or "image.png"
+        self.content_type = content_type or "application/octet-stream"
+        self.file = SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MAX_MEMORY)
+        self.size = 0
+        self.head = b""
+        self._hash = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        self._hash.update(data)
+        if len(self.head) < HEAD_BYTES:
+            self.head += data[:HEAD_BYTES - len(self.head)]
+        if self.file._rolled:
+            await run_in_threadpool(self.file.write, data) # Disk write, keep it off the event loop
+        else:
+            self.file.write(data)
+
+    def rewind(self):
+        """Position the file at its start, ready to be (re-)sent upstream."""
+        self.file.seek(0)
+        return self.file
+
+    def read(self) -> bytes:
+        with self._lock:
+            return self.rewind().read()
+
+    def copy_to(self, destination: BinaryIO):
+        """Write the whole upload into `destination`. Blocks while reading a file spooled to disk."""
+        with self._lock:
+            shutil.copyfileobj(self.rewind(), destination)
+
+    def copy(self) -> "SpooledImage":
+        """An independent copy, for work that outlives the request. Blocks while copying a file spooled to disk."""
+        clone = SpooledImage(self.filename, self.content_type)
+        self.copy_to(clone.file)
+        clone.size = self.size
+        clone.head = self.head
+        clone._hash = self._hash.copy()
+        return clone
+
+    def close(self):
+        with self._lock: # Let a copy running in a worker thread finish first
+            self.file.close()
+
+class _ImagePartParser:
+    """python-multipart callbacks that keep only the image field and discard everything else."""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name.encode()
+        self.image: Optional[SpooledImage] = None
+        self.pending: List[bytes] = []
+        self._in_image_part = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._content_type = b""
+
+    def on_part_begin(self):
+        self._in_image_part = False
+        self._disposition = b""
+        self._content_type = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        name = self._header_name.lower()
+        if name == b"content-disposition":
+            self._disposition = self._header_value
+        elif name == b"content-type":
+            self._content_type = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if options.get(b"name") == self.field_name and b"filename" in options and self.image is None:
+            self._in_image_part = True
+            self.image = SpooledImage(
+                filename=options[b"filename"].decode("utf-8", errors="replace"),
+                content_type=self._content_type.decode("latin-1") or None,
+            )
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_image_part:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        self._in_image_part = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+def _payload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Image is too large. Maximum upload size is {settings.MAX_UPLOAD_BYTES / (1024 * 1024):.1f} MB."
+    )
+
+async def receive_image_upload(request: Request, field_name: str = "image") -> SpooledImage:
+    """
+    Streams a multipart/form-data request body and spools the image field to a
+    temporary file, enforcing MAX_UPLOAD_BYTES as the body arrives.
+    Oversized requests are rejected from Content-Length before any of the body
+    is read, or as soon as the streamed body crosses the limit.
+    """
+    content_type = request.headers.get("Content-Type")
+    if not content_type or not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Invalid Content-Type. Expected multipart/form-data.")
+
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Missing boundary in multipart/form-data request.")
+
+    max_body_bytes = settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_body_bytes:
+        raise _payload_too_large()
+
+    part_parser = _ImagePartParser(field_name)
+    parser = MultipartParser(boundary, part_parser.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body_bytes:
+                raise _payload_too_large()
+            parser.write(chunk)
+            image = part_parser.image
+            if image is not None and part_parser.pending:
+                for data in part_parser.pending:
+                    await image.write(data)
+                part_parser.pending.clear()
+                if image.size > settings.MAX_UPLOAD_BYTES:
+                    raise _payload_too_large()
+        parser.finalize()
+    except HTTPException:
+        if part_parser.image is not None:
+            part_parser.image.close()
+        raise
+    except Exception as e:
+        if part_parser.image is not None:
+            part_parser.image.close()
+        logger.warning(f"Malformed multipart upload: {e}")
+        raise HTTPException(status_code=400, detail="Malformed multipart/form-data request.")
+
+    image = part_parser.image
+    if image is None or image.size == 0:
+        if image is not None:
+            image.close()
+        raise HTTPException(status_code=400, detail="No image file provided.")
+    observe_upload_size("multipart", image.size)
+    image.rewind()
+    return image
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+from fastapi import HTTPException, status
+
+from metrics import record_upstream_outcome, track_upstream_in_flight
+from resilience import CircuitBreaker, UpstreamUnavailableError, is_congestion, is_upstream_failure
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class Endpoint:
+    """One Model API server: its own connection pool, circuit breaker and load figures."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient, breaker: Optional[CircuitBreaker] = None):
+        self.url = url.rstrip("/")
+        self.client = client
+        self.breaker = breaker
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None # seconds; None until the first response
+        self.healthy = True # Set by the active health checks
+        self.last_probe_ok: Optional[bool] = None # Whether the latest health probe was answered; None until probed
+        self._health_failures = 0
+        self._health_successes = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def available(self) -> bool:
+        # A half-open breaker whose single trial call is already in flight refuses calls just like an open one
+        return self.healthy and (self.breaker is None or self.breaker.would_allow())
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit_breaker": self.breaker.stats() if self.breaker is not None else None,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+        }
+
+def _outcome(error: Exception) -> str:
+    """Label for the upstream response counter: the status code, or why there was none."""
+    if isinstance(error, UpstreamUnavailableError):
+        return "rejected" # Circuit open; the endpoint was not called
+    if isinstance(error, HTTPException):
+        return str(error.status_code)
+    return "error"
+
+class UpstreamBalancer:
+    """
+    Spreads Model API calls over several endpoints.
+
+    Strategies:
+        least_outstanding - the endpoint with the fewest requests in flight
+        ewma              - the lowest latency EWMA scaled by requests in flight,
+                            so a fast endpoint is preferred until it starts to queue
+
+    A failed call (5xx, timeout, connection error) is recorded in the EWMA as
+    taking at least `health_timeout`, so an endpoint that fails fast does not
+    look like the fastest one and keep drawing the retries.
+
+    Endpoints whose circuit breaker would refuse the call are skipped: open,
+    or half-open with its trial call in flight. Active health checks eject an
+    endpoint after `eject_after` consecutive failed probes and re-admit it after
+    `readmit_after` consecutive good ones. Any answer below 500 counts as good:
+    the probe is there to find servers that are down, not to validate the path.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        strategy: str = "ewma",
+        ewma_alpha: float = 0.3,
+        health_path: Optional[str] = "/health",
+        health_interval: float = 5.0,
+        health_timeout: float = 2.0,
+        eject_after: int = 2,
+        readmit_after: int = 2,
+        health_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.eject_after = eject_after
+        self.readmit_after = readmit_after
+        self.health_headers = health_headers or {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    # --- Selection ---
+    def _score(self, endpoint: Endpoint) -> float:
+        if self.strategy == "least_outstanding":
+            return endpoint.outstanding
+        # Unmeasured endpoints score 0 so they get probed with real traffic first
+        return (endpoint.ewma_latency or 0.0) * (endpoint.outstanding + 1)
+
+    def pick(self) -> Endpoint:
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available()]
+        if not candidates:
+            raise UpstreamUnavailableError(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="No healthy Model API endpoint is available. Please try again shortly.",
+                headers={"Retry-After": str(max(1, round(self.health_interval)))}
+            )
+        random.shuffle(candidates) # Spread ties instead of always picking the first endpoint
+        return min(candidates, key=self._score)
+
+    async def call(self, send: Callable[[Endpoint], Awaitable[T]]) -> T:
+        """Send one request to the best endpoint, tracking its load, latency and breaker."""
+        endpoint = self.pick()
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        track_upstream_in_flight(endpoint.url, 1)
+        started = time.perf_counter()
+        try:
+            if endpoint.breaker is not None:
+                result = await endpoint.breaker.call(lambda: send(endpoint))
+            else:
+                result = await send(endpoint)
+        except asyncio.CancelledError:
+            record_upstream_outcome(endpoint.url, "cancelled")
+            raise
+        except Exception as e:
+            if is_upstream_failure(e):
+                endpoint.failures += 1
+            if is_congestion(e):
+                self._record_latency(endpoint, max(time.perf_counter() - started, self.health_timeout))
+            record_upstream_outcome(endpoint.url, _outcome(e))
+            raise
+        finally:
+            endpoint.outstanding -= 1
+            track_upstream_in_flight(endpoint.url, -1)
+        record_upstream_outcome(endpoint.url, "200")
+        self._record_latency(endpoint, time.perf_counter() - started)
+        return result
+
+    def _record_latency(self, endpoint: Endpoint, latency: float):
+        if endpoint.ewma_latency is None:
+            endpoint.ewma_latency = latency
+        else:
+            endpoint.ewma_latency += self.ewma_alpha * (latency - endpoint.ewma_latency)
+
+    def reachable(self) -> bool:
+        """
+        Whether some endpoint would take a call and answered its latest health
+        probe. Unlike ejection, one missed probe is enough to say no: this is for
+        readiness reporting, not for routing.
+        """
+        return any(endpoint.available() and endpoint.last_probe_ok is not False for endpoint in self.endpoints)
+
+    # --- Active health checks ---
+    async def _probe(self, endpoint: Endpoint) -> bool:
+        try:
+            response = await endpoint.client.get(
+                f"{endpoint.url}{self.health_path}", headers=self.health_headers, timeout=self.health_timeout
+            )
+            return response.status_code < 500
+        except httpx.HTTPError:
+            return False
+
+    async def check_health(self):
+        if not self.health_path:
+            return
+        results = await asyncio.gather(*(self._probe(endpoint) for endpoint in self.endpoints))
+        for endpoint, ok in zip(self.endpoints, results):
+            endpoint.last_probe_ok = ok
+            if ok:
+                endpoint._health_failures = 0
+                endpoint._health_successes += 1
+                if not endpoint.healthy and endpoint._health_successes >= self.readmit_after:
+                    endpoint.healthy = True
+                    logger.info(f"Model API endpoint {endpoint.url} re-admitted.")
+            else:
+                endpoint._health_successes = 0
+                endpoint._health_failures += 1
+                if endpoint.healthy and endpoint._health_failures >= self.eject_after:
+                    endpoint.healthy = False
+                    endpoint.ejections += 1
+                    logger.warning(f"Model API endpoint {endpoint.url} ejected after {endpoint._health_failures} failed health checks.")
+
+    async def _check_health_periodically(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Model API health check failed: {e}", exc_info=True)
+
+    def start(self):
+        if self.health_path and self._health_task is None:
+            self._health_task = asyncio.create_task(self._check_health_periodically())
+            logger.info(f"Model API health checks started for {len(self.endpoints)} endpoint(s) every {self.health_interval:.0f}s.")
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(endpoint.client.aclose() for endpoint in self.endpoints))
+
+    def stats(self) -> Dict:
+        return {"strategy": self.strategy, "endpoints": [endpoint.stats() for endpoint in self.endpoints]}
@@ -0,0 +1,127 @@
+"""
+Load balancing across several Model API endpoints, against local stub servers.
+
+Starts three bench/stub_model_api.py servers on consecutive ports with
+different inference costs (a fast, a medium and a slow "GPU"), points
+MODEL_API_BASE_URLS at all of them and pushes unique images through
+services.process_image_with_model:
+
+  1. once per balancing strategy, reporting throughput, latency and how the
+     requests were spread over the endpoints;
+  2. a failover run that kills the fast server part-way through and restarts
+     it, reporting failed requests and the health-check ejections and
+     re-admissions.
+
+The LaTeX cache is disabled so every image reaches a model server.
+
+Run from the server directory:
+    python bench/bench_balancing.py --requests 600 --concurrency 24
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+from bench_batching import _wait_until_healthy
+
+def _start_stub(port: int, base_ms: float, slots: int) -> subprocess.Popen:
+    return subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_model_api.py"),
+        "--port", str(port), "--base-ms", str(base_ms), "--per-image-ms", "0", "--slots", str(slots),
+    ])
+
+async def _run(services, total: int, concurrency: int) -> dict:
+    from fastapi import HTTPException
+
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            image_data = os.urandom(16) + i.to_bytes(4, "big")
+            started = time.perf_counter()
+            try:
+                await services.process_image_with_model(image_data)
+                latencies.append(time.perf_counter() - started)
+            except HTTPException:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+    }
+
+def _spread(services) -> dict:
+    return {
+        endpoint["url"].rsplit(":", 1)[-1]: {key: endpoint[key] for key in ("requests", "failures", "ejections", "healthy")}
+        for endpoint in services.get_model_pool_stats()["endpoints"]
+    }
+
+async def main(args):
+    ports = [args.port + i for i in range(len(args.base_ms))]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    os.environ["MODEL_API_BASE_URLS"] = ",".join(urls)
+    os.environ["LATEX_CACHE_ENABLED"] = "false"
+    os.environ["MODEL_API_HEALTH_INTERVAL"] = str(args.health_interval)
+    import services
+    from config import settings
+
+    stubs = [_start_stub(port, base_ms, args.slots) for port, base_ms in zip(ports, args.base_ms)]
+    try:
+        for url in urls:
+            await _wait_until_healthy(url)
+
+        for strategy in ("least_outstanding", "ewma"):
+            settings.MODEL_API_LB_STRATEGY = strategy
+            await services.init_model_client()
+            result = await _run(services, args.requests, args.concurrency)
+            print(f"{strategy:>17}: {result}\n{'':>19}{_spread(services)}")
+            await services.close_model_client()
+
+        # Failover: take the fast server down for a while in the middle of a run
+        await services.init_model_client()
+
+        async def outage():
+            await asyncio.sleep(args.outage_after)
+            stubs[0].kill() # A crash, not a graceful shutdown
+            await asyncio.to_thread(stubs[0].wait)
+            await asyncio.sleep(args.outage_seconds)
+            stubs[0] = _start_stub(ports[0], args.base_ms[0], args.slots)
+
+        outage_task = asyncio.create_task(outage())
+        result = await _run(services, args.requests * 3, args.concurrency)
+        await outage_task
+        await _wait_until_healthy(urls[0])
+        await asyncio.sleep(args.health_interval * (settings.MODEL_API_HEALTH_READMIT_AFTER + 1))
+        print(f"{'failover':>17}: {result}\n{'':>19}{_spread(services)}")
+        await services.close_model_client()
+    finally:
+        for stub in stubs:
+            stub.terminate()
+            stub.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=24)
+    parser.add_argument("--port", type=int, default=8101, help="first stub port; one port per --base-ms value")
+    parser.add_argument("--base-ms", type=float, nargs="+", default=[20, 40, 80], help="inference cost of each stub server")
+    parser.add_argument("--slots", type=int, default=4, help="concurrent inference calls per stub server")
+    parser.add_argument("--health-interval", type=float, default=0.5, help="seconds between health checks")
+    parser.add_argument("--outage-after", type=float, default=0.5, help="seconds into the failover run the fast server is stopped")
+    parser.add_argument("--outage-seconds", type=float, default=1.5, help="how long it stays down")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""
+Compares OCR throughput with and without micro-batching against the stub Model API.
+
+Starts bench/stub_model_api.py in a subprocess, then pushes CONCURRENCY
+concurrent streams of unique images through services.process_image_with_model
+with batching disabled and enabled. The LaTeX cache is disabled so every
+image reaches the model.
+
+Run from the server directory:
+    python bench/bench_batching.py --requests 400 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+async def _wait_until_healthy(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/health")).status_code == 200:
+                    return
+            except httpx.RequestError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Stub Model API at {url} did not become healthy")
+
+async def _run(services, total: int, concurrency: int) -> dict:
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            image_data = os.urandom(16) + i.to_bytes(4, "big")
+            started = time.perf_counter()
+            await services.process_image_with_model(image_data)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+async def main(args):
+    url = f"http://127.0.0.1:{args.port}"
+    os.environ["MODEL_API_BASE_URL"] = url
+    os.environ["LATEX_CACHE_ENABLED"] = "false"
+    import services
+    from config import settings
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_model_api.py"), "--port", str(args.port),
+        "--base-ms", str(args.base_ms), "--per-image-ms", str(args.per_image_ms), "--slots", str(args.slots),
+    ])
+    try:
+        await _wait_until_healthy(url)
+        await services.init_model_client()
+        for batching in (False, True):
+            settings.MODEL_API_BATCHING_ENABLED = batching
+            settings.MODEL_API_BATCH_WINDOW_MS = args.window_ms
+            settings.MODEL_API_BATCH_MAX_SIZE = args.max_batch
+            await services.start_batch_dispatcher()
+            result = await _run(services, args.requests, args.concurrency)
+            result["batching"] = services.get_batching_stats()
+            await services.stop_batch_dispatcher()
+            print(f"batching={'on ' if batching else 'off'} {result}")
+        await services.close_model_client()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--base-ms", type=float, default=40)
+    parser.add_argument("--per-image-ms", type=float, default=5)
+    parser.add_argument("--slots", type=int, default=1)
+    parser.add_argument("--window-ms", type=float, default=10)
+    parser.add_argument("--max-batch", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
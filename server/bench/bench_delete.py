@@ -0,0 +1,72 @@
+"""
+Time to delete a conversation with 10, 100 and 1000 messages, before and after
+moving to batched deletes.
+
+  before - the original repository code: stream every message and delete it
+           with its own round trip, one after another
+  after  - ChatRepository.delete_conversation: ID-only pages of message
+           references, deleted with batched writes committed concurrently
+
+Both run against the in-memory fake in fake_firestore.py with the same
+simulated round-trip latency.
+
+Run from the server directory:
+    python bench/bench_delete.py --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+from fake_firestore import FakeFirestore
+from repository import ChatRepository
+
+UID = "bench-user"
+CONVERSATION_ID = "conv_bench"
+
+def _seed(client: FakeFirestore, messages: int):
+    base = f"users/{UID}/conversations/{CONVERSATION_ID}"
+    client.store.docs[base] = {
+        "id": CONVERSATION_ID, "title": "t", "createdAt": 0, "lastMessageAt": 0, "messageCount": messages, "userType": "authenticated",
+    }
+    for i in range(messages):
+        client.store.docs[f"{base}/messages/msg_{i}"] = {
+            "id": f"msg_{i}", "conversationId": CONVERSATION_ID, "type": "bot", "latex": "x^2", "timestamp": i,
+        }
+
+async def _sequential_delete(repository: ChatRepository):
+    # The pre-batching repository body
+    async for doc in repository.messages_ref(UID, CONVERSATION_ID).stream():
+        await doc.reference.delete()
+    await repository.conversations_ref(UID).document(CONVERSATION_ID).delete()
+
+async def _batched_delete(repository: ChatRepository, batch_size: int, concurrency: int):
+    await repository.delete_conversation(UID, CONVERSATION_ID, batch_size=batch_size, concurrency=concurrency)
+
+async def main(args):
+    for messages in args.messages:
+        for name, delete in (
+            ("before", _sequential_delete),
+            ("after", lambda repository: _batched_delete(repository, args.batch_size, args.concurrency)),
+        ):
+            db = FakeFirestore(latency_ms=args.latency_ms)
+            _seed(db, messages)
+            rpcs_before = db.rpcs
+            started = time.perf_counter()
+            await delete(ChatRepository(db))
+            elapsed = time.perf_counter() - started
+            assert not db.store.docs, "conversation was not fully deleted"
+            print(f"{messages:>5} messages {name:>6}: {{'seconds': {elapsed:.3f}, 'round_trips': {db.rpcs - rpcs_before}}}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000], help="conversation sizes to delete")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated Firestore round-trip time")
+    parser.add_argument("--batch-size", type=int, default=500, help="writes per batch commit")
+    parser.add_argument("--concurrency", type=int, default=4, help="batch commits in flight at once")
+    asyncio.run(main(parser.parse_args()))
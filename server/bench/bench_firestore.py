@@ -0,0 +1,116 @@
+"""
+Concurrent request throughput of the chat handlers' Firestore access, before and after
+moving to the async repository.
+
+  before - the original handler code: synchronous Client calls inside `async def`
+           handlers, which block the event loop for every round trip
+  after  - repository.ChatRepository on an AsyncClient
+
+Both run against the in-memory fake in fake_firestore.py with the same
+simulated round-trip latency, using a mix of list-conversations,
+list-messages and add-message requests.
+
+Run from the server directory:
+    python bench/bench_firestore.py --requests 300 --concurrency 50 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+from google.cloud import firestore
+
+from fake_firestore import FakeFirestore
+from repository import ChatRepository
+
+UID = "bench-user"
+CONVERSATION_ID = "conv_bench"
+
+def _seed(client: FakeFirestore, messages: int):
+    conversations = client.store.docs
+    base = f"users/{UID}/conversations"
+    for i in range(20):
+        conversations[f"{base}/conv_{i}"] = {
+            "id": f"conv_{i}", "title": "t", "createdAt": i, "lastMessageAt": i, "messageCount": 0, "userType": "authenticated",
+        }
+    conversations[f"{base}/{CONVERSATION_ID}"] = {
+        "id": CONVERSATION_ID, "title": "t", "createdAt": 0, "lastMessageAt": 0, "messageCount": messages, "userType": "authenticated",
+    }
+    for i in range(messages):
+        conversations[f"{base}/{CONVERSATION_ID}/messages/msg_{i}"] = {
+            "id": f"msg_{i}", "conversationId": CONVERSATION_ID, "type": "bot", "latex": "x^2", "timestamp": i,
+        }
+
+# --- The pre-repository handler bodies, calling the synchronous client ---
+class BlockingHandlers:
+    def __init__(self, db):
+        self.db = db
+
+    def _conversations(self):
+        return self.db.collection('users').document(UID).collection('conversations')
+
+    async def list_conversations(self):
+        docs = self._conversations().order_by('lastMessageAt', direction=firestore.Query.DESCENDING).stream()
+        return [doc.to_dict() for doc in docs]
+
+    async def list_messages(self):
+        query = self._conversations().document(CONVERSATION_ID).collection('messages').order_by('timestamp', direction=firestore.Query.ASCENDING)
+        return [doc.to_dict() for doc in query.stream()]
+
+    async def add_message(self, i: int):
+        conv_ref = self._conversations().document(CONVERSATION_ID)
+        if not conv_ref.get().exists:
+            raise RuntimeError("missing conversation")
+        conv_ref.collection('messages').document(f"new_{i}").set({"id": f"new_{i}", "timestamp": 10**9 + i})
+        conv_ref.update({"lastMessageAt": 10**9 + i, "messageCount": firestore.Increment(1)})
+
+class RepositoryHandlers:
+    def __init__(self, db):
+        self.repository = ChatRepository(db)
+
+    async def list_conversations(self):
+        return await self.repository.list_conversations(UID, 50)
+
+    async def list_messages(self):
+        return await self.repository.list_messages(UID, CONVERSATION_ID, 50)
+
+    async def add_message(self, i: int):
+        await self.repository.add_message(UID, CONVERSATION_ID, {"id": f"new_{i}", "timestamp": 10**9 + i})
+
+async def _drive(handlers, total: int, concurrency: int) -> dict:
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            kind = i % 3
+            if kind == 0:
+                await handlers.list_conversations()
+            elif kind == 1:
+                await handlers.list_messages()
+            else:
+                await handlers.add_message(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"requests": total, "seconds": round(elapsed, 2), "rps": round(total / elapsed, 1)}
+
+async def main(args):
+    for name, async_mode, handler_class in (("before", False, BlockingHandlers), ("after", True, RepositoryHandlers)):
+        db = FakeFirestore(async_mode=async_mode, latency_ms=args.latency_ms)
+        _seed(db, args.messages)
+        result = await _drive(handler_class(db), args.requests, args.concurrency)
+        print(f"{name:>6}: {result}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated Firestore round-trip time")
+    parser.add_argument("--messages", type=int, default=50, help="messages in the benchmarked conversation")
+    asyncio.run(main(parser.parse_args()))
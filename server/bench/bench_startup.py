@@ -0,0 +1,112 @@
+"""
+Cold-start time of the backend: how long a fresh process takes to import
+main.py, run the lifespan startup, answer /health and report ready on /ready.
+
+Each run is a new interpreter, as on a new autoscaled instance. Firebase is
+initialized from a throwaway service account generated for the run, so
+credential parsing is included. The remote round trips of the startup
+warm-up are simulated: fetching the token signing certificates sleeps
+--cert-ms, the Firestore warm-up read goes to the in-memory fake with
+--firestore-ms of latency, and the Model API is bench/stub_model_api.py.
+
+Run from the server directory:
+    python bench/bench_startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+def _service_account() -> str:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    return json.dumps({
+        "type": "service_account", "project_id": "bench", "private_key_id": "bench", "private_key": pem,
+        "client_email": "bench@bench.iam.gserviceaccount.com", "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    })
+
+async def _measure(args) -> dict:
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    import auth
+    import httpx
+    from fake_firestore import FakeFirestore
+    from repository import ChatRepository
+
+    auth._fetch_id_token_certificates = lambda: time.sleep(args.cert_ms / 1000)
+    main.app.state.chat_repository = ChatRepository(FakeFirestore(latency_ms=args.firestore_ms))
+
+    async with main.lifespan(main.app):
+        started_up = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            await client.get("/health")
+            first_response = time.perf_counter()
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.002)
+            ready = time.perf_counter()
+    return {
+        "import_ms": (imported - started) * 1000,
+        "lifespan_ms": (started_up - imported) * 1000,
+        "first_response_ms": (first_response - started) * 1000,
+        "ready_ms": (ready - started) * 1000,
+    }
+
+async def _start_stub(port: int) -> subprocess.Popen:
+    from bench_batching import _wait_until_healthy
+
+    stub = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "stub_model_api.py"), "--port", str(port)])
+    await _wait_until_healthy(f"http://127.0.0.1:{port}")
+    return stub
+
+def main(args):
+    env = dict(
+        os.environ,
+        FIREBASE_SERVICE_ACCOUNT_KEY_JSON=_service_account(),
+        MODEL_API_BASE_URL=f"http://127.0.0.1:{args.port}",
+    )
+    stub = asyncio.run(_start_stub(args.port))
+    runs = []
+    try:
+        for _ in range(args.runs):
+            spawned = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, __file__, "--child", "--cert-ms", str(args.cert_ms), "--firestore-ms", str(args.firestore_ms)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            result["process_to_ready_ms"] = (time.perf_counter() - spawned) * 1000 # includes interpreter start and exit
+            runs.append(result)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"median of {args.runs} cold starts:")
+    for key in runs[0]:
+        print(f"  {key:>20}: {statistics.median(run[key] for run in runs):7.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8101, help="stub Model API port")
+    parser.add_argument("--cert-ms", type=float, default=100, help="simulated certificate fetch")
+    parser.add_argument("--firestore-ms", type=float, default=50, help="simulated Firestore round trip of the warm-up read")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(_measure(args))))
+    else:
+        main(args)
@@ -0,0 +1,124 @@
+"""
+Compares peak RSS of the buffered and streaming /process-image upload paths.
+
+Each mode runs in a fresh subprocess that feeds CONCURRENCY simultaneous
+multipart uploads of SIZE_MB each through:
+  buffered  - request.form() + UploadFile.read() + an in-memory multipart body (the old path)
+  streaming - uploads.receive_image_upload() + a file-backed multipart body
+and forwards the result to an in-process transport that drains the upstream
+request body, so no network or Model API is needed.
+
+Run from the server directory:
+    python bench/bench_upload_memory.py --size-mb 8 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+BOUNDARY = "benchboundary"
+CHUNK = os.urandom(64 * 1024)
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # ru_maxrss is in KiB on Linux
+
+def _multipart_chunks(size: int):
+    yield (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"photo.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode()
+    sent = 0
+    while sent < size:
+        piece = CHUNK[: min(len(CHUNK), size - sent)]
+        sent += len(piece)
+        yield piece
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+def _make_request(size: int):
+    from starlette.requests import Request
+    chunks = list(_multipart_chunks(size)) # Chunks share CHUNK, so this list is small
+    body_length = sum(len(c) for c in chunks)
+    iterator = iter(chunks)
+
+    async def receive():
+        chunk = next(iterator, None)
+        return {"type": "http.request", "body": chunk or b"", "more_body": chunk is not None}
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/process-image", "query_string": b"",
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(body_length).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+def _draining_client():
+    import httpx
+
+    class DrainTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            async for _ in request.stream:
+                await asyncio.sleep(0) # Let other uploads interleave like a real socket would
+            return httpx.Response(200, json={"formula": "x", "processing_time": 0.0})
+
+    return httpx.AsyncClient(transport=DrainTransport())
+
+async def _run_mode(mode: str, size: int, concurrency: int):
+    os.environ.setdefault("MODEL_API_BASE_URL", "http://model-api.invalid")
+    os.environ["LATEX_CACHE_ENABLED"] = "false"
+    os.environ["MAX_UPLOAD_BYTES"] = str(size * 2)
+    import services
+    import uploads
+
+    services._balancer = services.create_balancer(_draining_client)
+    baseline = _peak_rss_mb()
+
+    async def buffered():
+        request = _make_request(size)
+        form = await request.form()
+        image_data = await form.get("image").read()
+        await services._call_model_api(image_data)
+        await form.close()
+
+    async def streaming():
+        image = await uploads.receive_image_upload(_make_request(size))
+        try:
+            await services._call_model_api(image)
+        finally:
+            image.close()
+
+    handler = buffered if mode == "buffered" else streaming
+    await asyncio.gather(*(handler() for _ in range(concurrency)))
+    print(json.dumps({"mode": mode, "baseline_rss_mb": round(baseline, 1), "peak_rss_mb": round(_peak_rss_mb(), 1)}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mode", choices=["buffered", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = int(args.size_mb * 1024 * 1024)
+
+    if args.mode:
+        asyncio.run(_run_mode(args.mode, size, args.concurrency))
+        return
+
+    print(f"{args.concurrency} concurrent uploads of {args.size_mb} MB")
+    for mode in ("buffered", "streaming"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--size-mb", str(args.size_mb), "--concurrency", str(args.concurrency)],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        print(f"{mode:>9}: peak RSS {result['peak_rss_mb']} MB (baseline {result['baseline_rss_mb']} MB, "
+              f"+{round(result['peak_rss_mb'] - result['baseline_rss_mb'], 1)} MB)")
+
+if __name__ == "__main__":
+    main()
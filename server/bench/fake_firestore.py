@@ -0,0 +1,250 @@
+"""
+In-memory stand-in for the parts of the Firestore client API the backend uses.
+
+FakeFirestore(async_mode=True) mimics google.cloud.firestore.AsyncClient and
+FakeFirestore(async_mode=False) mimics the synchronous Client. Every RPC
+(document get/set/update/delete, query stream, batch commit) costs
+`latency_ms`: the async fake awaits it, the sync fake blocks the thread with
+time.sleep() exactly like a real gRPC round trip would block the event loop.
+
+Supported: collection/document references, order_by (including __name__),
+limit, start_after (dict or snapshot), select, stream/get, set/update/delete
+with Increment, and atomic WriteBatch commits.
+"""
+import asyncio
+import copy
+import functools
+import time
+from typing import Any, Dict, List, Optional
+
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1.transforms import Increment
+
+DOCUMENT_ID = "__name__"
+
+class _Store:
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.rpcs = 0
+
+    def children(self, collection_path: str) -> List[str]:
+        prefix = collection_path + "/"
+        depth = collection_path.count("/") + 1
+        return [path for path in self.docs if path.startswith(prefix) and path.count("/") == depth]
+
+    def apply_update(self, path: str, data: Dict[str, Any]):
+        if path not in self.docs:
+            raise NotFound(f"No document to update: {path}")
+        doc = self.docs[path]
+        for field, value in data.items():
+            if isinstance(value, Increment):
+                doc[field] = doc.get(field, 0) + value.value
+            else:
+                doc[field] = copy.deepcopy(value)
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+class _Rpc:
+    """Charges one simulated round trip, awaited or blocking depending on the client mode."""
+
+    def __init__(self, client: "FakeFirestore"):
+        self.client = client
+
+    def _call(self, fn):
+        store = self.client.store
+        latency = self.client.latency_ms / 1000
+        if self.client.async_mode:
+            async def run():
+                store.rpcs += 1
+                if latency:
+                    await asyncio.sleep(latency)
+                return fn()
+            return run()
+        store.rpcs += 1
+        if latency:
+            time.sleep(latency)
+        return fn()
+
+class FakeDocumentReference(_Rpc):
+    def __init__(self, client: "FakeFirestore", path: str):
+        super().__init__(client)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self.client, f"{self.path}/{name}")
+
+    def _snapshot(self) -> FakeDocumentSnapshot:
+        return FakeDocumentSnapshot(self, self.client.store.docs.get(self.path))
+
+    def get(self):
+        return self._call(self._snapshot)
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        def run():
+            if merge and self.path in self.client.store.docs:
+                self.client.store.docs[self.path].update(copy.deepcopy(data))
+            else:
+                self.client.store.docs[self.path] = copy.deepcopy(data)
+        return self._call(run)
+
+    def update(self, data: Dict[str, Any]):
+        return self._call(lambda: self.client.store.apply_update(self.path, data))
+
+    def delete(self):
+        return self._call(lambda: self.client.store.docs.pop(self.path, None))
+
+class FakeQuery(_Rpc):
+    def __init__(self, client: "FakeFirestore", collection_path: str):
+        super().__init__(client)
+        self.collection_path = collection_path
+        self._orders: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._start_after: Optional[List[Any]] = None
+        self._fields: Optional[List[str]] = None
+
+    def _copy(self) -> "FakeQuery":
+        query = FakeQuery(self.client, self.collection_path)
+        query._orders = list(self._orders)
+        query._limit = self._limit
+        query._start_after = self._start_after
+        query._fields = self._fields
+        return query
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        query = self._copy()
+        query._orders.append((field, direction))
+        return query
+
+    def limit(self, count: int) -> "FakeQuery":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def select(self, fields: List[str]) -> "FakeQuery":
+        query = self._copy()
+        query._fields = list(fields)
+        return query
+
+    def start_after(self, document_fields) -> "FakeQuery":
+        query = self._copy()
+        if isinstance(document_fields, FakeDocumentSnapshot):
+            values = dict(document_fields.to_dict(), **{DOCUMENT_ID: document_fields.id})
+        else:
+            values = dict(document_fields)
+        query._start_after = [values.get(field) for field, _ in self._orders]
+        return query
+
+    def _sort_key(self, path: str, data: Dict[str, Any]) -> List[Any]:
+        return [path.rsplit("/", 1)[-1] if field == DOCUMENT_ID else data.get(field) for field, _ in self._orders]
+
+    def _compare(self, left: List[Any], right: List[Any]) -> int:
+        for (_, direction), a, b in zip(self._orders, left, right):
+            if a == b:
+                continue
+            result = -1 if a < b else 1
+            return -result if direction == "DESCENDING" else result
+        return 0
+
+    def _run(self) -> List[FakeDocumentSnapshot]:
+        store = self.client.store
+        rows = [(path, store.docs[path]) for path in store.children(self.collection_path)]
+        rows = [(path, data) for path, data in rows if all(field == DOCUMENT_ID or field in data for field, _ in self._orders)]
+        rows.sort(key=functools.cmp_to_key(lambda x, y: self._compare(self._sort_key(*x), self._sort_key(*y))))
+        if self._start_after is not None:
+            rows = [row for row in rows if self._compare(self._sort_key(*row), self._start_after) > 0]
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        snapshots = []
+        for path, data in rows:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            snapshots.append(FakeDocumentSnapshot(FakeDocumentReference(self.client, path), data))
+        return snapshots
+
+    def stream(self):
+        if self.client.async_mode:
+            async def generate():
+                for snapshot in await self._call(self._run):
+                    yield snapshot
+            return generate()
+        return iter(self._call(self._run))
+
+    def get(self):
+        return self._call(self._run)
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client: "FakeFirestore", path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self.client, f"{self.collection_path}/{document_id}")
+
+class FakeWriteBatch(_Rpc):
+    def __init__(self, client: "FakeFirestore"):
+        super().__init__(client)
+        self._writes: List[tuple] = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(("set", reference.path, data))
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._writes.append(("update", reference.path, data))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._writes.append(("delete", reference.path, None))
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def _apply(self):
+        store = self.client.store
+        snapshot = copy.deepcopy(store.docs)
+        try:
+            for operation, path, data in self._writes:
+                if operation == "set":
+                    store.docs[path] = copy.deepcopy(data)
+                elif operation == "update":
+                    store.apply_update(path, data)
+                else:
+                    store.docs.pop(path, None)
+        except Exception:
+            store.docs = snapshot # All or nothing, like a real commit
+            raise
+        return [None] * len(self._writes)
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes.")
+        return self._call(self._apply)
+
+class FakeFirestore:
+    def __init__(self, async_mode: bool = True, latency_ms: float = 0.0, store: Optional[_Store] = None):
+        self.async_mode = async_mode
+        self.latency_ms = latency_ms
+        self.store = store or _Store()
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    @property
+    def rpcs(self) -> int:
+        return self.store.rpcs
@@ -0,0 +1,379 @@
+"""
+Load-testing harness for the whole backend, with local stand-ins for every
+external service:
+
+  Firebase Auth - auth.verify_id_token is replaced by a fake verifier that
+                  accepts "bench-<uid>" tokens (with optional simulated cost)
+  Firestore     - the in-memory fake from fake_firestore.py injected as the
+                  app's chat repository client, or the Firestore emulator when
+                  --firestore emulator is given (FIRESTORE_EMULATOR_HOST must be set)
+  Model API     - bench/stub_model_api.py with configurable latency
+
+The real FastAPI app from main.py, lifespan included, is driven in-process
+through httpx.ASGITransport by --users concurrent virtual users, each looping
+over one scenario for --duration seconds:
+
+  browse - list conversations, open one, page back through its messages
+  chat   - create a conversation, send a burst of --burst messages at once,
+           rename it and reload its messages
+  upload - upload a --upload-mb image to a conversation (stores the image,
+           runs OCR against the stub and stores the reply)
+
+Each scenario runs in a fresh subprocess so peak RSS is measured per scenario.
+Results (p50/p95/p99 latency overall and per operation, RPS, errors, peak RSS)
+are printed and, with --output, written as JSON. --baseline compares against
+an earlier JSON file and exits with status 1 when a latency percentile or RPS
+regresses by more than --tolerance.
+
+Run from the server directory:
+    python bench/harness.py --users 20 --duration 10 --output bench-results.json
+    python bench/harness.py --scenarios upload --upload-mb 4 --baseline bench-results.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+SCENARIOS = ("browse", "chat", "upload")
+TOKEN_PREFIX = "bench-"
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # ru_maxrss is in KiB on Linux
+
+def _percentile(ordered: List[float], percentile: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(len(ordered) * percentile / 100)) - 1))
+    return round(ordered[index] * 1000, 1)
+
+def _latency_summary(latencies: List[float]) -> Dict:
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        "count": len(ordered),
+        "p50_ms": _percentile(ordered, 50),
+        "p95_ms": _percentile(ordered, 95),
+        "p99_ms": _percentile(ordered, 99),
+    }
+
+# --- Stand-ins, installed before the app handles any request ---
+def _install_fakes(args):
+    import firebase_admin
+    import google.auth.credentials
+    from firebase_admin import credentials
+
+    class _AnonymousCredential(credentials.Base):
+        def get_credential(self):
+            return google.auth.credentials.AnonymousCredentials()
+
+    # An app without a service account, so the lifespan finds Firebase initialized without a project
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(_AnonymousCredential(), {"projectId": "bench"})
+
+    import auth
+    import main
+    from repository import ChatRepository
+
+    def verify_id_token(id_token: str, *_, **__) -> Dict:
+        if args.verify_ms:
+            time.sleep(args.verify_ms / 1000) # Runs on the verification thread pool, like the real check
+        if not id_token.startswith(TOKEN_PREFIX):
+            raise ValueError("Not a benchmark token")
+        uid = id_token[len(TOKEN_PREFIX):]
+        return {"uid": uid, "name": uid, "firebase": {"sign_in_provider": "password"}}
+
+    auth.auth.verify_id_token = verify_id_token
+    auth._fetch_id_token_certificates = lambda: None # No Google certificates to fetch
+    if args.firestore == "memory":
+        from fake_firestore import FakeFirestore
+        main.app.state.chat_repository = ChatRepository(FakeFirestore(latency_ms=args.firestore_latency_ms))
+
+def _noise_png(size_bytes: int, seed: int) -> bytes:
+    """An incompressible grayscale PNG of roughly size_bytes."""
+    from PIL import Image
+
+    side = max(16, int(size_bytes ** 0.5))
+    pixels = random.Random(seed).randbytes(side * side)
+    buffer = io.BytesIO()
+    Image.frombytes("L", (side, side), pixels).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+# --- Scenarios: one session of one virtual user, returning after a few requests ---
+class VirtualUser:
+    def __init__(self, client, uid: str, record):
+        self.client = client
+        self.uid = uid
+        self.headers = {"Authorization": f"Bearer {TOKEN_PREFIX}{uid}"}
+        self.record = record
+        self.conversation_ids: List[str] = []
+
+    async def request(self, operation: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except Exception as e:
+            self.record(operation, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.record(operation, time.perf_counter() - started, response.status_code)
+        return response
+
+async def _seed(repository, uid: str, conversations: int, messages: int) -> List[str]:
+    """Give a user conversations to browse, bypassing the API so seeding stays out of the numbers."""
+    conversation_ids = []
+    for c in range(conversations):
+        conversation_id = f"conv_seed_{c}"
+        conversation = {
+            "id": conversation_id, "title": f"Seeded {c}", "createdAt": c, "lastMessageAt": c * messages,
+            "messageCount": messages, "userType": "authenticated",
+        }
+        message_docs = [
+            {"id": f"msg_{i:06d}", "conversationId": conversation_id, "type": "user" if i % 2 == 0 else "bot",
+             "content": f"message {i}", "latex": "x^2", "timestamp": c * messages + i}
+            for i in range(messages)
+        ]
+        store = getattr(repository.db, "store", None)
+        if store is not None: # In-memory fake: write the documents directly
+            base = f"users/{uid}/conversations/{conversation_id}"
+            store.docs[base] = conversation
+            for message in message_docs:
+                store.docs[f"{base}/messages/{message['id']}"] = message
+        else:
+            await repository.create_conversation(uid, conversation)
+            for message in message_docs:
+                await repository.add_message(uid, conversation_id, message)
+        conversation_ids.append(conversation_id)
+    return conversation_ids
+
+async def browse(user: VirtualUser, args, images: List[bytes]):
+    response = await user.request("list_conversations", "GET", "/chat/conversations")
+    if response is None or response.status_code != 200:
+        return
+    items = response.json()["items"]
+    if not items:
+        return
+    conversation_id = random.choice(items)["id"]
+    cursor = None
+    for _ in range(args.pages):
+        params = {"limit": args.page_size}
+        if cursor:
+            params["cursor"] = cursor
+        response = await user.request("list_messages", "GET", f"/chat/conversations/{conversation_id}/messages", params=params)
+        if response is None or response.status_code != 200:
+            return
+        cursor = response.json().get("nextCursor")
+        if not cursor:
+            return
+
+async def chat(user: VirtualUser, args, images: List[bytes]):
+    response = await user.request("create_conversation", "POST", "/chat/conversations")
+    if response is None or response.status_code != 200:
+        return
+    conversation_id = response.json()["id"]
+    await asyncio.gather(*(
+        user.request("add_message", "POST", f"/chat/conversations/{conversation_id}/messages", json={"type": "user", "content": f"burst {i}"})
+        for i in range(args.burst)
+    ))
+    await user.request("update_title", "PUT", f"/chat/conversations/{conversation_id}/title", json={"title": "Benchmark"})
+    await user.request("list_messages", "GET", f"/chat/conversations/{conversation_id}/messages")
+
+async def upload(user: VirtualUser, args, images: List[bytes]):
+    if not user.conversation_ids:
+        response = await user.request("create_conversation", "POST", "/chat/conversations")
+        if response is None or response.status_code != 200:
+            return
+        user.conversation_ids.append(response.json()["id"])
+    await user.request(
+        "upload_image", "POST", f"/chat/conversations/{user.conversation_ids[0]}/images",
+        files={"image": ("bench.png", random.choice(images), "image/png")},
+    )
+
+SCENARIO_FUNCTIONS = {"browse": browse, "chat": chat, "upload": upload}
+
+async def _run_scenario(args) -> Dict:
+    os.environ["MODEL_API_BASE_URL"] = args.model_api_url
+    os.environ["LATEX_CACHE_ENABLED"] = "false" # Every upload reaches the stub Model API
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false") # Virtual users are far faster than people
+    os.environ["BLOB_STORE_BACKEND"] = "local"
+    os.environ["BLOB_STORE_DIR"] = args.blob_dir
+    os.environ["MAX_UPLOAD_BYTES"] = str(max(int(args.upload_mb * 2 * 1024 * 1024), 10 * 1024 * 1024))
+    _install_fakes(args)
+    import httpx
+    import main
+
+    images = [_noise_png(int(args.upload_mb * 1024 * 1024), seed) for seed in range(args.upload_variants)] if args.scenario == "upload" else []
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, int] = defaultdict(int)
+
+    def record(operation: str, elapsed: float, status):
+        latencies[operation].append(elapsed)
+        statuses[str(status)] += 1
+
+    scenario = SCENARIO_FUNCTIONS[args.scenario]
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            while (await client.get("/ready")).status_code != 200: # Let the startup warm-up finish first
+                await asyncio.sleep(0.05)
+            users = [VirtualUser(client, f"user{i}", record) for i in range(args.users)]
+            if args.scenario == "browse":
+                for user in users:
+                    user.conversation_ids = await _seed(main.app.state.chat_repository, user.uid, args.seed_conversations, args.seed_messages)
+            baseline_rss = _peak_rss_mb()
+
+            deadline = time.perf_counter() + args.duration
+            async def run_user(user: VirtualUser):
+                while time.perf_counter() < deadline:
+                    await scenario(user, args, images)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run_user(user) for user in users))
+            elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "scenario": args.scenario,
+        "users": args.users,
+        "duration_s": round(elapsed, 2),
+        "requests": len(all_latencies),
+        "errors": errors,
+        "status_codes": dict(statuses),
+        "rps": round(len(all_latencies) / elapsed, 1),
+        **{key: value for key, value in _latency_summary(all_latencies).items() if key != "count"},
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "operations": {operation: _latency_summary(values) for operation, values in sorted(latencies.items())},
+    }
+
+# --- Parent process: stub server, one subprocess per scenario, report ---
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BENCH_DIR).stdout.strip()
+    except OSError:
+        return ""
+
+def _compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions beyond `tolerance` (a fraction) in latency percentiles or RPS."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if current.get(key) and previous.get(key) and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}.{key}: {previous[key]} -> {current[key]}")
+        if current.get("rps") and previous.get("rps") and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}.rps: {previous['rps']} -> {current['rps']}")
+    return regressions
+
+def _child_arguments(args, scenario: str, model_api_url: str, blob_dir: str) -> List[str]:
+    forwarded = [
+        "--users", str(args.users), "--duration", str(args.duration), "--firestore", args.firestore,
+        "--firestore-latency-ms", str(args.firestore_latency_ms), "--verify-ms", str(args.verify_ms),
+        "--seed-conversations", str(args.seed_conversations), "--seed-messages", str(args.seed_messages),
+        "--pages", str(args.pages), "--page-size", str(args.page_size), "--burst", str(args.burst),
+        "--upload-mb", str(args.upload_mb), "--upload-variants", str(args.upload_variants),
+    ]
+    return [sys.executable, __file__, "--scenario", scenario, "--model-api-url", model_api_url, "--blob-dir", blob_dir, *forwarded]
+
+async def _start_stub(args) -> subprocess.Popen:
+    from bench_batching import _wait_until_healthy
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_model_api.py"), "--port", str(args.port),
+        "--base-ms", str(args.base_ms), "--per-image-ms", str(args.per_image_ms), "--slots", str(args.slots),
+    ])
+    await _wait_until_healthy(f"http://127.0.0.1:{args.port}")
+    return stub
+
+def main(args):
+    if args.firestore == "emulator" and not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("--firestore emulator needs FIRESTORE_EMULATOR_HOST (e.g. localhost:8080)")
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "scenario", "model_api_url", "blob_dir")},
+        "scenarios": {},
+    }
+    blob_dir = tempfile.mkdtemp(prefix="bench-blobs-")
+    stub = asyncio.run(_start_stub(args))
+    try:
+        for scenario in args.scenarios:
+            completed = subprocess.run(
+                _child_arguments(args, scenario, f"http://127.0.0.1:{args.port}", blob_dir),
+                capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                sys.stderr.write(completed.stderr)
+                sys.exit(f"Scenario '{scenario}' failed")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results["scenarios"][scenario] = result
+            print(
+                f"{scenario:>7}: {result['requests']} requests, {result['rps']} req/s, "
+                f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, "
+                f"{result['errors']} errors, peak RSS {result['peak_rss_mb']} MB"
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+        shutil.rmtree(blob_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10, help="seconds each scenario runs")
+    parser.add_argument("--firestore", choices=["memory", "emulator"], default="memory")
+    parser.add_argument("--firestore-latency-ms", type=float, default=5, help="simulated round trip of the in-memory Firestore")
+    parser.add_argument("--verify-ms", type=float, default=1, help="simulated cost of one ID token verification")
+    parser.add_argument("--seed-conversations", type=int, default=10, help="conversations per user before browsing")
+    parser.add_argument("--seed-messages", type=int, default=60, help="messages per seeded conversation")
+    parser.add_argument("--pages", type=int, default=3, help="message pages read per browsed conversation")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=5, help="messages sent at once in the chat scenario")
+    parser.add_argument("--upload-mb", type=float, default=2, help="size of uploaded images")
+    parser.add_argument("--upload-variants", type=int, default=4, help="distinct images to cycle through")
+    parser.add_argument("--port", type=int, default=8101, help="stub Model API port")
+    parser.add_argument("--base-ms", type=float, default=40, help="stub inference cost per call")
+    parser.add_argument("--per-image-ms", type=float, default=5)
+    parser.add_argument("--slots", type=int, default=4, help="stub concurrent inference calls")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed regression as a fraction")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--model-api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--blob-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(asyncio.run(_run_scenario(args))))
+    else:
+        main(args)
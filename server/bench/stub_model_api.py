@@ -0,0 +1,98 @@
+"""
+Local stand-in for the Model API Backend, for benchmarking without a GPU.
+/predict/stream streams the formula token by token as NDJSON.
+
+Simulates a GPU with a fixed number of inference slots. A single /predict
+call costs BASE + PER_IMAGE milliseconds; a /predict/batch call of N images
+costs BASE + N * PER_IMAGE, so batching amortizes the fixed per-call cost
+the same way a real model server does.
+
+Run:
+    python stub_model_api.py --port 8001 --base-ms 40 --per-image-ms 5 --slots 1
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+BASE_MS = float(os.getenv("STUB_BASE_MS", "40"))
+PER_IMAGE_MS = float(os.getenv("STUB_PER_IMAGE_MS", "5"))
+SLOTS = int(os.getenv("STUB_SLOTS", "1"))
+FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+
+app = FastAPI(title="Stub Model API")
+_gpu_slots: asyncio.Semaphore = None
+_stats = {"predict_calls": 0, "batch_calls": 0, "images": 0}
+
+def _fake_formula(image_data: bytes) -> str:
+    digest = hashlib.sha256(image_data).hexdigest()
+    return f"\\frac{{{digest[:4]}}}{{{digest[4:8]}}}"
+
+async def _run_inference(image_count: int) -> float:
+    global _gpu_slots
+    if _gpu_slots is None:
+        _gpu_slots = asyncio.Semaphore(SLOTS)
+    async with _gpu_slots:
+        if FAILURE_RATE and random.random() < FAILURE_RATE:
+            raise HTTPException(status_code=503, detail="Stub model failure")
+        started = time.perf_counter()
+        await asyncio.sleep((BASE_MS + PER_IMAGE_MS * image_count) / 1000)
+        return time.perf_counter() - started
+
+@app.post("/predict")
+async def predict(file: UploadFile = File(...)):
+    image_data = await file.read()
+    elapsed = await _run_inference(1)
+    _stats["predict_calls"] += 1
+    _stats["images"] += 1
+    return {"formula": _fake_formula(image_data), "processing_time": elapsed}
+
+@app.post("/predict/batch")
+async def predict_batch(files: List[UploadFile] = File(...)):
+    images = [await f.read() for f in files]
+    elapsed = await _run_inference(len(images))
+    _stats["batch_calls"] += 1
+    _stats["images"] += len(images)
+    return {"results": [{"formula": _fake_formula(image_data), "processing_time": elapsed} for image_data in images]}
+
+@app.post("/predict/stream")
+async def predict_stream(file: UploadFile = File(...)):
+    """Same cost as /predict, emitted as NDJSON: one {"token"} line per formula character, then the result."""
+    image_data = await file.read()
+    formula = _fake_formula(image_data)
+    _stats["predict_calls"] += 1
+    _stats["images"] += 1
+
+    async def generate():
+        started = time.perf_counter()
+        per_token = (BASE_MS + PER_IMAGE_MS) / 1000 / len(formula)
+        for char in formula:
+            await asyncio.sleep(per_token)
+            yield json.dumps({"token": char}) + "\n"
+        yield json.dumps({"formula": formula, "processing_time": time.perf_counter() - started}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", **_stats}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--base-ms", type=float, default=BASE_MS, help="fixed cost of every inference call")
+    parser.add_argument("--per-image-ms", type=float, default=PER_IMAGE_MS, help="marginal cost per image")
+    parser.add_argument("--slots", type=int, default=SLOTS, help="concurrent inference calls (GPU streams)")
+    parser.add_argument("--failure-rate", type=float, default=FAILURE_RATE, help="fraction of calls answered with 503")
+    args = parser.parse_args()
+    BASE_MS, PER_IMAGE_MS, SLOTS, FAILURE_RATE = args.base_ms, args.per_image_ms, args.slots, args.failure_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")